@@ -0,0 +1,61 @@
+"""
+Compares the pdf extraction backends on the same plans, for speed and for producing the same tables.
+Usage: python -m benchmarks.extraction_backends <area> <plan.pdf>... [--repeat N]
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import Optional
+
+from substitution_parsing.PDFHandling import PDF
+from substitution_parsing.extraction import BACKENDS
+
+TableData = tuple[Optional[str], list[str], list[list[Optional[str]]]]
+
+
+def extract(file: Path, area: str, backend: str) -> list[TableData]:
+    with PDF.from_file(file, area, backend=backend) as pdf:
+        return [(table.title, table.head, table.rows) for table in pdf.iter_tables()]
+
+
+def benchmark(file: Path, area: str, backend: str, repeat: int) -> tuple[float, list[TableData]]:
+    """Returns the best time of repeat runs and the extracted tables"""
+    best: float = float('inf')
+    tables: list[TableData] = []
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        tables = extract(file, area, backend)
+        best = min(best, time.perf_counter() - start)
+    return best, tables
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('area')
+    parser.add_argument('plans', nargs='+', type=Path)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for file in args.plans:
+        print(file)
+        baseline: Optional[list[TableData]] = None
+        for backend in BACKENDS:
+            try:
+                duration, tables = benchmark(file, args.area, backend, args.repeat)
+            except ImportError as e:
+                print(f'  {backend:>8}: not installed ({e.name})')
+                continue
+            rows: int = sum(len(table[2]) for table in tables)
+            if baseline is None:
+                baseline = tables
+                equivalence: str = 'baseline'
+            elif tables == baseline:
+                equivalence = 'same tables'
+            else:
+                differing: int = sum(a != b for a, b in zip(tables, baseline)) + abs(len(tables) - len(baseline))
+                equivalence = f'{differing} of {len(baseline)} tables differ'
+            print(f'  {backend:>8}: {duration * 1000:8.1f} ms, {len(tables)} tables, {rows} rows, {equivalence}')
+
+
+if __name__ == '__main__':
+    main()
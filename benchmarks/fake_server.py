@@ -0,0 +1,307 @@
+"""
+A local stand-in for geschuetzt.bszet.de. Serves the plan directory listing and the plan pdfs from a recorded
+archive, behind the same basic auth, and can inject latency, errors, stalls and listing timestamp changes.
+In replay mode the revisions of the archive are published one after the other, speed times faster than recorded.
+Usage:
+  python -m benchmarks.fake_server record <archive> --user U --password P [--interval S]
+  python -m benchmarks.fake_server synthesize <archive> [--areas A...] [--revisions N] [--pages N]
+  python -m benchmarks.fake_server serve <archive> [--port N] [--replay --speed X] [--latency S] [--error-rate R]
+Point the bot at it with PLAN_BASE_URL=http://localhost:8080.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import random
+import time
+from collections import Counter
+from email.utils import formatdate
+from pathlib import Path
+from typing import Optional
+
+from aiohttp import BasicAuth, web
+
+from substitution_parsing.fetcher import Fetcher, FetchResult
+from substitution_parsing.listing_parser import parse_listing
+
+from .plan_generator import generate_plan
+
+LISTING_ROW: str = (
+    '<tr><td class="FileListCellIcon"><img src="pdf.png"></td>'
+    '<td class="FileListCellText"><a href="{href}">{name}</a></td>'
+    '<td class="FileListCellInfo">{modified}</td></tr>'
+)
+
+
+class Revision:
+    """One version of a plan, offset is the number of seconds after the start of the recording it appeared"""
+
+    def __init__(self, plan: str, offset: float, digest: str) -> None:
+        self.plan: str = plan
+        self.offset: float = offset
+        self.digest: str = digest
+
+    def to_dict(self) -> dict:
+        return {'plan': self.plan, 'offset': self.offset, 'digest': self.digest}
+
+    @staticmethod
+    def from_dict(data: dict) -> Revision:
+        return Revision(data['plan'], data['offset'], data['digest'])
+
+
+class Archive:
+    """A directory with revisions.json and one pdf per distinct plan content, named by its digest"""
+
+    def __init__(self, directory: Path) -> None:
+        self.directory: Path = directory
+        self.start: float = time.time()
+        self.revisions: list[Revision] = []
+        if (directory / 'revisions.json').exists():
+            data: dict = json.loads((directory / 'revisions.json').read_text())
+            self.start = data['start']
+            self.revisions = sorted((Revision.from_dict(i) for i in data['revisions']), key=lambda r: r.offset)
+
+    @property
+    def duration(self) -> float:
+        return self.revisions[-1].offset if self.revisions else 0.0
+
+    @property
+    def plans(self) -> list[str]:
+        return sorted({revision.plan for revision in self.revisions})
+
+    def content(self, revision: Revision) -> bytes:
+        return (self.directory / f'{revision.digest}.pdf').read_bytes()
+
+    def add(self, plan: str, offset: float, content: bytes) -> Revision:
+        digest: str = hashlib.sha256(content).hexdigest()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path: Path = self.directory / f'{digest}.pdf'
+        if not path.exists():
+            path.write_bytes(content)
+        revision: Revision = Revision(plan, offset, digest)
+        self.revisions.append(revision)
+        self.revisions.sort(key=lambda r: r.offset)
+        return revision
+
+    def latest(self, plan: str, offset: float = float('inf')) -> Optional[Revision]:
+        """The revision of plan that was current offset seconds into the recording"""
+        result: Optional[Revision] = None
+        for revision in self.revisions:
+            if revision.offset > offset:
+                break
+            if revision.plan == plan:
+                result = revision
+        return result
+
+    def save(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        data: dict = {'start': self.start, 'revisions': [revision.to_dict() for revision in self.revisions]}
+        (self.directory / 'revisions.json').write_text(json.dumps(data, indent=1))
+
+
+class FakeServer:
+    """
+    Serves an archive over http. Without replay, the latest revision of every plan is served.
+    latency is the mean delay of every response, error_rate the share of requests answered with a 503,
+    stall_rate the share of requests that only answer after stall seconds, to trigger client timeouts.
+    With touch_interval, the listing timestamps move forward every touch_interval recorded seconds
+    even though the content stays the same.
+    """
+
+    def __init__(
+        self, archive: Archive, auth: tuple[str, str] = ('user', 'password#1'), replay: bool = False,
+        speed: float = 60.0, latency: float = 0.0, error_rate: float = 0.0, stall_rate: float = 0.0,
+        stall: float = 60.0, touch_interval: Optional[float] = None, seed: Optional[int] = None
+    ) -> None:
+        self.archive: Archive = archive
+        self.auth: BasicAuth = BasicAuth(*auth)
+        self.replay: bool = replay
+        self.speed: float = speed
+        self.latency: float = latency
+        self.error_rate: float = error_rate
+        self.stall_rate: float = stall_rate
+        self.stall: float = stall
+        self.touch_interval: Optional[float] = touch_interval
+        self.random: random.Random = random.Random(seed)
+        self.started: float = time.monotonic()
+        # responses by path kind and status, e.g. ('pdf', 304)
+        self.responses: Counter[tuple[str, int]] = Counter()
+        self.app: web.Application = web.Application()
+        self.app.router.add_get('/index.php', self.__listing)
+        self.app.router.add_get(r'/{plan:.+\.pdf}', self.__plan)
+        self.__runner: Optional[web.AppRunner] = None
+
+    @property
+    def offset(self) -> float:
+        """The recorded second that is currently served"""
+        if not self.replay:
+            return float('inf')
+        return (time.monotonic() - self.started) * self.speed
+
+    @property
+    def finished(self) -> bool:
+        return self.offset > self.archive.duration
+
+    def published_at(self, revision: Revision) -> float:
+        """The time.monotonic() at which revision is, or was, first served"""
+        return self.started + revision.offset / self.speed if self.replay else self.started
+
+    def __listing_timestamp(self, revision: Revision) -> float:
+        offset: float = revision.offset
+        if self.touch_interval and self.replay:
+            offset = max(offset, self.offset // self.touch_interval * self.touch_interval)
+        return self.archive.start + offset
+
+    async def __inject(self, kind: str) -> Optional[web.Response]:
+        """Delays the response and returns the injected error, if any"""
+        if self.latency:
+            await asyncio.sleep(self.random.uniform(0.5, 1.5) * self.latency)
+        if self.random.random() < self.stall_rate:
+            await asyncio.sleep(self.stall)
+        if self.random.random() < self.error_rate:
+            self.responses[(kind, 503)] += 1
+            return web.Response(status=503, text='Service Unavailable')
+        return None
+
+    def __unauthorized(self, request: web.Request, kind: str) -> Optional[web.Response]:
+        header: Optional[str] = request.headers.get('Authorization')
+        try:
+            if header and BasicAuth.decode(header) == self.auth:
+                return None
+        except ValueError:
+            pass
+        self.responses[(kind, 401)] += 1
+        return web.Response(status=401, headers={'WWW-Authenticate': 'Basic realm="geschuetzt"'})
+
+    async def __listing(self, request: web.Request) -> web.Response:
+        if error := self.__unauthorized(request, 'listing') or await self.__inject('listing'):
+            return error
+        rows: list[str] = []
+        for plan in self.archive.plans:
+            if revision := self.archive.latest(plan, self.offset):
+                modified: str = datetime.datetime.fromtimestamp(self.__listing_timestamp(revision))\
+                    .strftime('%d.%m.%Y, %H:%M:%S')
+                rows.append(LISTING_ROW.format(href=plan, name=plan.rsplit('/', 1)[-1], modified=modified))
+        self.responses[('listing', 200)] += 1
+        return web.Response(
+            text=f'<html><body><table class="FileList">{"".join(rows)}</table></body></html>',
+            content_type='text/html'
+        )
+
+    async def __plan(self, request: web.Request) -> web.Response:
+        if error := self.__unauthorized(request, 'pdf') or await self.__inject('pdf'):
+            return error
+        revision: Optional[Revision] = self.archive.latest(request.match_info['plan'], self.offset)
+        if revision is None:
+            self.responses[('pdf', 404)] += 1
+            return web.Response(status=404)
+        headers: dict[str, str] = {
+            'ETag': f'"{revision.digest}"',
+            'Last-Modified': formatdate(self.archive.start + revision.offset, usegmt=True),
+        }
+        if request.headers.get('If-None-Match') == headers['ETag']:
+            self.responses[('pdf', 304)] += 1
+            return web.Response(status=304, headers=headers)
+        self.responses[('pdf', 200)] += 1
+        return web.Response(body=self.archive.content(revision), headers=headers, content_type='application/pdf')
+
+    async def start(self, host: str = 'localhost', port: int = 8080) -> None:
+        self.__runner = web.AppRunner(self.app)
+        await self.__runner.setup()
+        await web.TCPSite(self.__runner, host, port).start()
+        self.started = time.monotonic()
+
+    async def stop(self) -> None:
+        if self.__runner:
+            await self.__runner.cleanup()
+            self.__runner = None
+
+
+async def record(archive: Archive, auth: tuple[str, str], interval: float) -> None:
+    """Polls the real server and adds every new plan content to the archive, until interrupted"""
+    if not archive.revisions:
+        archive.start = time.time()
+    async with Fetcher() as fetcher:
+        while True:
+            listing: Optional[bytes] = await fetcher.get_listing(auth)
+            for plan in parse_listing(listing.decode('utf-8', errors='replace')) if listing else {}:
+                result: Optional[FetchResult] = await fetcher.get(plan, auth)
+                latest: Optional[Revision] = archive.latest(plan)
+                if result and (not latest or latest.digest != hashlib.sha256(result.content).hexdigest()):
+                    archive.add(plan, time.time() - archive.start, result.content)
+                    archive.save()
+                    print(f'recorded a new revision of {plan}')
+            await asyncio.sleep(interval)
+
+
+def synthesize(archive: Archive, areas: list[str], revisions: int, pages: int, seed: int = 0) -> None:
+    """
+    Fills the archive with a week of generated revisions per area, recorded from today on.
+    Like the real plans, they mostly change on school days before and after the morning lessons.
+    The plans cover the school days from today on, so replaying them produces notifications.
+    """
+    rng: random.Random = random.Random(seed)
+    today: datetime.date = datetime.date.today()
+    archive.start = datetime.datetime.combine(today, datetime.time()).timestamp()
+    for area in areas:
+        offsets: list[float] = []
+        while len(offsets) < revisions:
+            day: datetime.date = today + datetime.timedelta(days=rng.randrange(7))
+            if day.weekday() >= 5:
+                continue
+            hour: float = rng.choice([rng.gauss(6.5, 0.5), rng.gauss(13.0, 1.0)])
+            offsets.append((day - today).days * 24 * 60 * 60 + hour * 60 * 60)
+        offsets.sort()
+        for offset in offsets:
+            content, _ = generate_plan(area, pages, seed=rng.randrange(2 ** 32), start=today)
+            archive.add(f'Vertretungsplaene/vertretungsplan-{area}.pdf', round(offset), content)
+    archive.save()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    record_parser = commands.add_parser('record')
+    record_parser.add_argument('archive', type=Path)
+    record_parser.add_argument('--user', required=True)
+    record_parser.add_argument('--password', required=True)
+    record_parser.add_argument('--interval', type=float, default=60.0)
+    synthesize_parser = commands.add_parser('synthesize')
+    synthesize_parser.add_argument('archive', type=Path)
+    synthesize_parser.add_argument('--areas', nargs='+', default=['bs-it', 'bs-et', 'bgy'])
+    synthesize_parser.add_argument('--revisions', type=int, default=20)
+    synthesize_parser.add_argument('--pages', type=int, default=3)
+    synthesize_parser.add_argument('--seed', type=int, default=0)
+    serve_parser = commands.add_parser('serve')
+    serve_parser.add_argument('archive', type=Path)
+    serve_parser.add_argument('--host', default='localhost')
+    serve_parser.add_argument('--port', type=int, default=8080)
+    serve_parser.add_argument('--user', default='user')
+    serve_parser.add_argument('--password', default='password#1')
+    serve_parser.add_argument('--replay', action='store_true')
+    serve_parser.add_argument('--speed', type=float, default=60.0)
+    serve_parser.add_argument('--latency', type=float, default=0.0)
+    serve_parser.add_argument('--error-rate', type=float, default=0.0)
+    serve_parser.add_argument('--stall-rate', type=float, default=0.0)
+    serve_parser.add_argument('--touch-interval', type=float)
+    args = parser.parse_args()
+
+    archive: Archive = Archive(args.archive)
+    if args.command == 'record':
+        asyncio.run(record(archive, (args.user, args.password), args.interval))
+    elif args.command == 'synthesize':
+        synthesize(archive, args.areas, args.revisions, args.pages, args.seed)
+        print(f'{len(archive.revisions)} revisions of {len(archive.plans)} plans')
+    else:
+        server: FakeServer = FakeServer(
+            archive, (args.user, args.password), args.replay, args.speed, args.latency, args.error_rate,
+            args.stall_rate, touch_interval=args.touch_interval
+        )
+        web.run_app(server.app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+"""
+Load test for the notification fan-out. Fills a database with users, classes and substitutions for both platforms,
+then runs the real tg_bot and dc_bot notifiers against local mock Bot API and Discord endpoints.
+The mocks enforce the platforms' rate limits and can inject 429s, Forbidden and timeouts.
+Reports per cycle and platform the p50/p99 delivery latency, messages/s and the time spent in DB calls.
+Usage: python -m benchmarks.fanout [--users N] [--classes N] [--cycles N] [--forbidden-rate R] ...
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+import discord.http
+from aiohttp import web
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+import dc_bot.dc_bot
+import tg_bot.update_users
+from substitution_parsing.Substitution import Substitution
+from util.DB import DB
+from util.message_cache import message_cache
+
+TELEGRAM: str = 'tg'
+DISCORD: str = 'dc'
+# discord channel ids are offset, so both platforms' users are easy to tell apart in the database
+DISCORD_OFFSET: int = 10 ** 9
+AREA: str = 'bs-it'
+
+
+class RateLimit:
+    """Non-blocking token bucket, like the servers keep it"""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate: float = rate
+        self.burst: float = burst
+        self.tokens: float = burst
+        self.updated: float = time.monotonic()
+
+    def take(self) -> bool:
+        now: float = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+def discord_json(data: dict, status: int = 200, headers: Optional[dict[str, str]] = None) -> web.Response:
+    # discord.py only decodes responses with exactly this content type, without a charset
+    return web.Response(
+        body=json.dumps(data).encode(), status=status, headers={'Content-Type': 'application/json', **(headers or {})}
+    )
+
+
+class MockApis:
+    """
+    The parts of the telegram Bot API and the discord REST API the notifiers use.
+    Chats in forbidden have blocked the bot, timeout_rate of the sends only answer after timeout_delay seconds,
+    and rate_limit_rate of the sends are answered with a 429 on top of the enforced limits.
+    """
+
+    def __init__(
+        self, forbidden: set[int], timeout_rate: float, timeout_delay: float, rate_limit_rate: float, latency: float
+    ) -> None:
+        self.forbidden: set[int] = forbidden
+        self.timeout_rate: float = timeout_rate
+        self.timeout_delay: float = timeout_delay
+        self.rate_limit_rate: float = rate_limit_rate
+        self.latency: float = latency
+        self.random: random.Random = random.Random(0)
+        # (platform, outcome)
+        self.responses: Counter[tuple[str, str]] = Counter()
+        # time.monotonic() of every delivered message per platform
+        self.deliveries: dict[str, list[float]] = defaultdict(list)
+        self.limits: dict[str, RateLimit] = {TELEGRAM: RateLimit(30.0, 30.0), DISCORD: RateLimit(50.0, 50.0)}
+        self.chat_limits: dict[tuple[str, int], RateLimit] = {}
+        self.app: web.Application = web.Application()
+        self.app.router.add_post('/bot{token}/getMe', self.__telegram_get_me)
+        self.app.router.add_post('/bot{token}/sendMessage', self.__telegram_send)
+        self.app.router.add_get('/api/v10/users/@me', self.__discord_get_me)
+        self.app.router.add_get('/api/v10/oauth2/applications/@me', self.__discord_application)
+        self.app.router.add_get('/api/v10/channels/{cid}', self.__discord_channel)
+        self.app.router.add_post('/api/v10/channels/{cid}/messages', self.__discord_send)
+
+    async def __fault(self, platform: str, chat: int) -> str:
+        """Decides the outcome of a send, after the injected delays"""
+        if self.latency:
+            await asyncio.sleep(self.random.uniform(0.5, 1.5) * self.latency)
+        if chat in self.forbidden:
+            return 'forbidden'
+        if self.random.random() < self.timeout_rate:
+            await asyncio.sleep(self.timeout_delay)
+            return 'timeout'
+        chat_limit: RateLimit = self.chat_limits.setdefault(
+            (platform, chat), RateLimit(1.0, 1.0) if platform == TELEGRAM else RateLimit(1.0, 5.0)
+        )
+        if self.random.random() < self.rate_limit_rate or not chat_limit.take() or not self.limits[platform].take():
+            return 'rate_limited'
+        return 'ok'
+
+    async def __telegram_get_me(self, _: web.Request) -> web.Response:
+        return web.json_response({'ok': True, 'result': {
+            'id': 1, 'is_bot': True, 'first_name': 'Vertretungsplan', 'username': 'mock_bot'
+        }})
+
+    async def __telegram_send(self, request: web.Request) -> web.Response:
+        params = await request.post()
+        chat: int = int(params['chat_id'])
+        outcome: str = await self.__fault(TELEGRAM, chat)
+        self.responses[(TELEGRAM, outcome)] += 1
+        if outcome == 'forbidden':
+            return web.json_response(
+                {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'}, status=403
+            )
+        if outcome == 'rate_limited':
+            return web.json_response({
+                'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                'parameters': {'retry_after': 1}
+            }, status=429)
+        self.deliveries[TELEGRAM].append(time.monotonic())
+        return web.json_response({'ok': True, 'result': {
+            'message_id': len(self.deliveries[TELEGRAM]), 'date': int(time.time()),
+            'chat': {'id': chat, 'type': 'private'}, 'text': params['text']
+        }})
+
+    @staticmethod
+    def __discord_user() -> dict:
+        return {'id': '1', 'username': 'Vertretungsplan', 'discriminator': '0', 'avatar': None, 'bot': True}
+
+    async def __discord_get_me(self, _: web.Request) -> web.Response:
+        return discord_json(self.__discord_user())
+
+    async def __discord_application(self, _: web.Request) -> web.Response:
+        return discord_json({
+            'id': '1', 'name': 'Vertretungsplan', 'icon': None, 'description': '', 'bot_public': True,
+            'bot_require_code_grant': False, 'owner': self.__discord_user(), 'verify_key': '', 'flags': 0,
+        })
+
+    async def __discord_channel(self, request: web.Request) -> web.Response:
+        cid: int = int(request.match_info['cid'])
+        if cid in self.forbidden:
+            self.responses[(DISCORD, 'forbidden')] += 1
+            return discord_json({'message': 'Missing Access', 'code': 50001}, status=403)
+        return discord_json({
+            'id': str(cid), 'type': 0, 'guild_id': '1', 'name': f'vertretungen-{cid}', 'position': 0,
+            'permission_overwrites': [], 'nsfw': False, 'parent_id': None,
+        })
+
+    async def __discord_send(self, request: web.Request) -> web.Response:
+        cid: int = int(request.match_info['cid'])
+        outcome: str = await self.__fault(DISCORD, cid)
+        self.responses[(DISCORD, outcome)] += 1
+        if outcome == 'forbidden':
+            return discord_json({'message': 'Missing Access', 'code': 50001}, status=403)
+        if outcome == 'timeout':
+            return discord_json({'message': 'Gateway Timeout', 'code': 0}, status=504)
+        if outcome == 'rate_limited':
+            # discord.py only trusts 429s that came through the api proxies
+            return discord_json(
+                {'message': 'You are being rate limited.', 'retry_after': 1.0, 'global': False}, status=429,
+                headers={'Via': '1.1 google', 'X-RateLimit-Scope': 'user'}
+            )
+        self.deliveries[DISCORD].append(time.monotonic())
+        data: dict = await request.json()
+        return discord_json({
+            'id': str(len(self.deliveries[DISCORD])), 'channel_id': str(cid), 'author': self.__discord_user(),
+            'content': data.get('content', ''), 'timestamp': datetime.datetime.now().isoformat(),
+            'edited_timestamp': None, 'tts': False, 'mention_everyone': False, 'mentions': [], 'mention_roles': [],
+            'attachments': [], 'embeds': [], 'pinned': False, 'type': 0,
+        })
+
+
+def seed(users: int, classes: int, substitutions: int) -> list[Substitution]:
+    """
+    Writes a plan with substitutions for the next days for every class, and subscribes users on each platform
+    to the classes round-robin. Returns the plan.
+    """
+    today: int = round(datetime.datetime.combine(datetime.date.today(), datetime.time()).timestamp())
+    gids: list[str] = [f'KL {i}' for i in range(classes)]
+    plan: list[Substitution] = [
+        Substitution(gid, today + i // 8 * 86400, i % 8 + 1, 'Mue', 'MA', 'A 1.01', None, AREA, True)
+        for gid in gids for i in range(substitutions)
+    ]
+    DB.apply_plan(AREA, plan)
+    with DB.connection() as transaction:
+        for platform, offset in ((TELEGRAM, 0), (DISCORD, DISCORD_OFFSET)):
+            transaction.executemany(
+                'insert into user (uid, platform, gid, trusted, last_seq) values (?, ?, ?, 1, 0)',
+                [(offset + i, platform, gids[i % classes]) for i in range(users)]
+            )
+    return plan
+
+
+def change_classes(plan: list[Substitution], share: float, rng: random.Random) -> list[Substitution]:
+    """Writes a new version of plan in which a share of the classes have another teacher, returns it"""
+    gids: list[str] = sorted({s.group for s in plan})
+    changed: set[str] = set(rng.sample(gids, round(len(gids) * share)))
+    teacher: str = rng.choice(['Sch', 'Web', 'Kli', 'Hof'])
+    plan = [
+        Substitution(s.group, s.day, s.lesson, teacher, s.subject, s.room, s.notes, AREA, True)
+        if s.group in changed else s for s in plan
+    ]
+    # like the substitution writer does
+    message_cache.invalidate(DB.apply_plan(AREA, plan).changed_classes)
+    return plan
+
+
+class DBTimer:
+    """Sums up the time the notifiers spend awaiting DB.read and DB.write"""
+
+    def __init__(self) -> None:
+        self.total: float = 0.0
+
+    def wrap(self, function: Callable[..., Awaitable]) -> classmethod:
+        async def timed(cls, *args, **kwargs):
+            start: float = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                self.total += time.perf_counter() - start
+
+        return classmethod(timed)
+
+
+def report(platform: str, started: float, finished: float, deliveries: list[float], db_time: float) -> None:
+    duration: float = finished - started
+    latencies: list[float] = sorted(delivery - started for delivery in deliveries)
+    if not latencies:
+        print(f'  {platform}: nothing delivered in {duration:.2f} s, {db_time:.3f} s in the DB')
+        return
+    p99: float = latencies[min(len(latencies) - 1, round(len(latencies) * 0.99))]
+    print(
+        f'  {platform}: {len(latencies)} messages in {duration:.2f} s, {len(latencies) / duration:.1f} msgs/s, '
+        f'latency p50 {statistics.median(latencies):.2f} s p99 {p99:.2f} s, {db_time:.3f} s in the DB'
+    )
+
+
+async def run(args: argparse.Namespace, directory: Path) -> None:
+    DB.init_db(directory / 'fanout.db')
+    plan: list[Substitution] = seed(args.users, args.classes, args.substitutions)
+    rng: random.Random = random.Random(1)
+    forbidden: set[int] = {
+        offset + i for offset in (0, DISCORD_OFFSET) for i in range(args.users) if rng.random() < args.forbidden_rate
+    }
+    apis: MockApis = MockApis(forbidden, args.timeout_rate, args.timeout_delay, args.rate_limit_rate, args.latency)
+    runner: web.AppRunner = web.AppRunner(apis.app)
+    await runner.setup()
+    await web.TCPSite(runner, 'localhost', args.port).start()
+    base_url: str = f'http://localhost:{args.port}'
+
+    timer: DBTimer = DBTimer()
+    DB.read = timer.wrap(DB.read)
+    DB.write = timer.wrap(DB.write)
+    discord.http.Route.BASE = f'{base_url}/api/v10'
+    client = dc_bot.dc_bot.client
+    await client.login('mock-token')
+    bot: Bot = Bot('mock-token', base_url=f'{base_url}/bot', request=HTTPXRequest(connection_pool_size=256))
+    platforms: dict[str, Callable[[], Awaitable[None]]] = {
+        TELEGRAM: lambda: tg_bot.update_users.notifier.notify(bot),
+        DISCORD: lambda: dc_bot.dc_bot.notifier.notify(),
+    }
+    try:
+        async with bot:
+            for cycle in range(args.cycles):
+                if cycle:
+                    plan = change_classes(plan, args.changed, rng)
+                    print(f'cycle {cycle + 1}, {round(args.classes * args.changed)} classes changed')
+                else:
+                    print(f'cycle 1, {args.users} users per platform')
+                for platform, notify in platforms.items():
+                    timer.total = 0.0
+                    delivered: int = len(apis.deliveries[platform])
+                    started: float = time.monotonic()
+                    await notify()
+                    report(platform, started, time.monotonic(), apis.deliveries[platform][delivered:], timer.total)
+        print(f'responses: {dict(apis.responses)}')
+    finally:
+        await client.close()
+        await runner.cleanup()
+        DB.writer.shutdown()
+        DB.readers.shutdown()
+        DB.conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1000, help='per platform')
+    parser.add_argument('--classes', type=int, default=200)
+    parser.add_argument('--substitutions', type=int, default=10, help='per class')
+    parser.add_argument('--cycles', type=int, default=3)
+    parser.add_argument('--changed', type=float, default=0.1, help='share of the classes changed between cycles')
+    parser.add_argument('--forbidden-rate', type=float, default=0.01)
+    parser.add_argument('--timeout-rate', type=float, default=0.005)
+    parser.add_argument('--timeout-delay', type=float, default=6.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.01)
+    parser.add_argument('--latency', type=float, default=0.05, help='mean response time of the apis')
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(args, Path(directory)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Compares the streaming listing parser with the BeautifulSoup one it replaced, for speed and for finding the same
+plans, on a listing shaped like the one of the plan server: plans between other files and folders.
+The cached run parses an unchanged listing again, which only hashes it.
+Usage: python -m benchmarks.listing_parser [--files N] [--repeat N]
+"""
+import argparse
+import datetime
+import random
+import time
+from typing import Callable
+
+from substitution_parsing.listing_parser import ListingCache, VERTRETUNGSPLAN_REGEX, parse_listing
+
+from .fake_server import LISTING_ROW
+
+AREAS: list[str] = ['bgy', 'bs-it', 'bs-et', 'bs-ka', 'bfs', 'fos']
+FOLDER_ROW: str = (
+    '<tr><td class="FileListCellIcon"><img src="folder.png"></td>'
+    '<td class="FileListCellText"><a href="?dir={name}">{name}</a></td>'
+    '<td class="FileListCellInfo">&nbsp;</td></tr>'
+)
+
+
+def bs4_parse_listing(listing: str) -> dict[str, int]:
+    """The parser used before, kept as the reference"""
+    from bs4 import BeautifulSoup
+    soup: BeautifulSoup = BeautifulSoup(listing, 'html.parser')
+    result: dict[str, int] = {}
+    for a in soup.find_all(href=VERTRETUNGSPLAN_REGEX):
+        tr = a.find_parent('tr')
+        last_updated_txt: str = tr.find(class_='FileListCellInfo').text.strip()
+        result[a['href']] = round(datetime.datetime.strptime(last_updated_txt, '%d.%m.%Y, %H:%M:%S').timestamp())
+    return result
+
+
+def generate_listing(files: int, seed: int = 0) -> bytes:
+    rng: random.Random = random.Random(seed)
+    rows: list[str] = [FOLDER_ROW.format(name=name) for name in ('Archiv', 'Stundenplaene', 'Formulare')]
+    names: list[str] = [f'Vertretungsplaene/vertretungsplan-{area}.pdf' for area in AREAS]
+    names += [f'Dokumente/dokument-{i}.{rng.choice(["pdf", "docx", "xlsx"])}' for i in range(files - len(names))]
+    rng.shuffle(names)
+    for name in names:
+        age: datetime.timedelta = datetime.timedelta(seconds=rng.randrange(60 * 24 * 60 * 60))
+        modified: str = (datetime.datetime(2026, 10, 19) - age).strftime('%d.%m.%Y, %H:%M:%S')
+        rows.append(LISTING_ROW.format(href=name, name=name.rsplit('/', 1)[-1], modified=modified))
+    return (
+        '<!DOCTYPE html><html><head><title>geschuetzt</title><link rel="stylesheet" href="style.css"></head>'
+        f'<body><div id="header">BSZ ET</div><table class="FileList">{"".join(rows)}</table></body></html>'
+    ).encode()
+
+
+def benchmark(function: Callable[[], dict[str, int]], repeat: int) -> tuple[float, dict[str, int]]:
+    """Returns the best time of repeat runs and the parsed plans"""
+    best: float = float('inf')
+    plans: dict[str, int] = {}
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        plans = function()
+        best = min(best, time.perf_counter() - start)
+    return best, plans
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, nargs='+', default=[20, 200, 2000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    for files in args.files:
+        listing: bytes = generate_listing(files)
+        print(f'{files} files, {len(listing) / 1024:.1f} KiB')
+        cache: ListingCache = ListingCache()
+        cache.parse(listing)
+        parsers: dict[str, Callable[[], dict[str, int]]] = {
+            'bs4': lambda: bs4_parse_listing(listing.decode()),
+            'stream': lambda: parse_listing(listing.decode()),
+            'cached': lambda: cache.parse(listing),
+        }
+        baseline: dict[str, int] = {}
+        for name, function in parsers.items():
+            try:
+                duration, plans = benchmark(function, args.repeat)
+            except ImportError as e:
+                print(f'  {name:>8}: not installed ({e.name})')
+                continue
+            if not baseline:
+                baseline = plans
+                equivalence: str = 'baseline'
+            else:
+                equivalence = 'same plans' if plans == baseline else 'plans differ'
+            print(f'  {name:>8}: {duration * 1000:8.3f} ms, {len(plans)} plans, {equivalence}')
+
+
+if __name__ == '__main__':
+    main()
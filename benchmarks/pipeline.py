@@ -0,0 +1,103 @@
+"""
+Measures the parsing pipeline on generated plans: pdf extraction and conversion to substitutions,
+then writing the plan into an empty database and writing a changed version of it on top.
+Reports rows/s, pages/s and the peak memory of every stage. Memory is traced in a separate run,
+tracing slows python down too much to time the same run.
+Usage: python -m benchmarks.pipeline [--area AREA] [--pages N...] [--repeat N] [--backend NAME]
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Optional, TypeVar
+
+from substitution_parsing.PDFHandling import PDF
+from substitution_parsing.Substitution import Substitution
+from util.DB import DB
+
+from .plan_generator import generate_plan
+
+T = TypeVar('T')
+
+
+class Measurement:
+    def __init__(self, stage: str, duration: float, peak_memory: int, rows: int, pages: int) -> None:
+        self.stage: str = stage
+        self.duration: float = duration
+        self.peak_memory: int = peak_memory
+        self.rows: int = rows
+        self.pages: int = pages
+
+    def __str__(self) -> str:
+        return (
+            f'{self.stage:>10}: {self.duration * 1000:9.1f} ms {self.rows / self.duration:10.0f} rows/s '
+            f'{self.pages / self.duration:8.1f} pages/s {self.peak_memory / 2 ** 20:8.2f} MiB peak'
+        )
+
+
+def measure(function: Callable[[], T], trace: bool) -> tuple[T, float, int]:
+    """Returns the result, the duration and, if traced, the peak of traced memory of one call"""
+    if not trace:
+        start: float = time.perf_counter()
+        return function(), time.perf_counter() - start, 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result: T = function()
+        duration: float = time.perf_counter() - start
+        return result, duration, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def parse(content: bytes, area: str, backend: Optional[str]) -> list[Substitution]:
+    with PDF.from_bytes(content, area, backend) as pdf:
+        return list(pdf.to_substitutions())
+
+
+def run(area: str, pages: int, backend: Optional[str], database: Path, trace: bool) -> list[Measurement]:
+    content, _ = generate_plan(area, pages, seed=1)
+    changed_content, _ = generate_plan(area, pages, seed=2)
+    DB.init_db(database)
+    try:
+        substitutions, duration, peak = measure(lambda: parse(content, area, backend), trace)
+        result: list[Measurement] = [Measurement('parse', duration, peak, len(substitutions), pages)]
+        _, duration, peak = measure(lambda: DB.apply_plan(area, substitutions), trace)
+        result.append(Measurement('db insert', duration, peak, len(substitutions), pages))
+        changed: list[Substitution] = parse(changed_content, area, backend)
+        _, duration, peak = measure(lambda: DB.apply_plan(area, changed), trace)
+        result.append(Measurement('db diff', duration, peak, len(changed), pages))
+        return result
+    finally:
+        DB.writer.shutdown()
+        DB.readers.shutdown()
+        DB.conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--area', default='bs-it')
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 5, 20])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--backend', help='defaults to PDF_BACKEND')
+    args = parser.parse_args()
+
+    for pages in args.pages:
+        print(f'{args.area}, {pages} pages')
+        best: dict[str, Measurement] = {}
+        for i in range(args.repeat + 1):
+            with tempfile.TemporaryDirectory() as directory:
+                # the first run only traces memory
+                for measurement in run(args.area, pages, args.backend, Path(directory) / 'benchmark.db', i == 0):
+                    if measurement.stage not in best:
+                        best[measurement.stage] = measurement
+                        measurement.duration = float('inf')
+                    else:
+                        best[measurement.stage].duration = min(best[measurement.stage].duration, measurement.duration)
+        for measurement in best.values():
+            print(measurement)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+Generates synthetic substitution plans that mimic the layouts published on geschuetzt.bszet.de,
+together with the substitutions a correct parse has to return.
+The bs-it layout has one date column per row, the other areas have one table per day with the date in its title.
+With quirks, some teacher and room cells are blank, tables repeat their header after a page break
+and every table has its columns shifted by a random offset, like in the published plans.
+Usage: python -m benchmarks.plan_generator <area> <pages> <out.pdf> [--seed N] [--quirks]
+"""
+import argparse
+import datetime
+import random
+from pathlib import Path
+from typing import Optional
+
+from substitution_parsing.Substitution import Substitution
+
+PAGE_WIDTH: int = 595
+PAGE_HEIGHT: int = 842
+MARGIN: int = 40
+LINE_HEIGHT: int = 12
+TABLE_GAP: int = 40
+
+IT_HEAD: list[str] = ['Datum', 'Tag', 'Std.', 'Lehrer', 'Fach', 'Raum', 'Klasse', 'Info']
+IT_COLUMNS: list[int] = [40, 100, 135, 170, 230, 290, 350, 430]
+OTHER_HEAD: list[str] = ['Klasse', 'Std.', 'Fach', 'Raum', 'Lehrer', 'Info']
+OTHER_COLUMNS: list[int] = [40, 120, 160, 240, 320, 400]
+
+WEEKDAYS: list[tuple[str, str]] = [('Mo', 'Montag'), ('Di', 'Dienstag'), ('Mi', 'Mittwoch'), ('Do', 'Donnerstag'),
+                                   ('Fr', 'Freitag')]
+TEACHERS: list[str] = ['Mue', 'Sch', 'Web', 'Kli', 'Hof', 'Lan', 'Bec', 'Wol', 'Neu', 'Zim', 'Kra', 'Bra']
+SUBJECTS: list[str] = ['MA', 'DE', 'EN', 'ET', 'IT', 'PH', 'GE', 'SP', 'ETH', 'WI']
+ROOMS: list[str] = ['A 1.01', 'A 1.12', 'B 2.04', 'B 2.15', 'C 0.08', 'Sporthalle']
+NOTES: list[Optional[str]] = [None, None, None, 'Ausfall', 'Aufgaben in LernSax', 'verlegt', 'Raumwechsel']
+# with quirks: share of the teacher and room cells left blank, and the largest column shift of a table
+BLANK_RATE: float = 0.1
+MAX_SHIFT: int = 30
+# a monday
+START: datetime.date = datetime.date(2026, 10, 19)
+
+
+def class_names(area: str, count: int) -> list[str]:
+    prefix: str = {'bs-it': 'IT', 'bs-et': 'ET', 'bgy': 'BGy'}.get(area, 'KL')
+    return [f'{prefix} {20 + i // 4}/{i % 4 + 1}' for i in range(count)]
+
+
+class PDFWriter:
+    """Writes the few pdf objects needed for pages of positioned Helvetica text, y is measured from the top"""
+
+    def __init__(self) -> None:
+        self.pages: list[list[tuple[float, float, str]]] = []
+
+    def new_page(self) -> None:
+        self.pages.append([])
+
+    def text(self, x: float, y: float, text: str) -> None:
+        self.pages[-1].append((x, y, text))
+
+    @staticmethod
+    def __escape(text: str) -> str:
+        return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    def __content(self, page: list[tuple[float, float, str]]) -> bytes:
+        # flip the coordinate system, so y grows downwards like in the published plans
+        lines: list[str] = [f'1 0 0 -1 0 {PAGE_HEIGHT} cm']
+        for x, y, text in page:
+            lines.append(f'BT /F1 9 Tf 1 0 0 -1 {x} {y} Tm ({self.__escape(text)}) Tj ET')
+        return '\n'.join(lines).encode('latin-1')
+
+    def to_bytes(self) -> bytes:
+        objects: list[bytes] = [
+            b'<< /Type /Catalog /Pages 2 0 R >>',
+            b'',  # pages, filled in below
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+        ]
+        page_ids: list[int] = []
+        for page in self.pages:
+            content: bytes = self.__content(page)
+            objects.append(b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream')
+            objects.append(
+                b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R '
+                b'/Resources << /Font << /F1 3 0 R >> >> >>' % (PAGE_WIDTH, PAGE_HEIGHT, len(objects))
+            )
+            page_ids.append(len(objects))
+        kids: bytes = b' '.join(b'%d 0 R' % i for i in page_ids)
+        objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(page_ids))
+
+        result: bytearray = bytearray(b'%PDF-1.4\n')
+        offsets: list[int] = []
+        for i, obj in enumerate(objects, start=1):
+            offsets.append(len(result))
+            result += b'%d 0 obj\n' % i + obj + b'\nendobj\n'
+        xref: int = len(result)
+        result += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+        for offset in offsets:
+            result += b'%010d 00000 n \n' % offset
+        result += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+        return bytes(result)
+
+
+class PlanGenerator:
+    def __init__(
+        self, area: str, seed: int = 0, start: datetime.date = START, quirks: bool = False
+    ) -> None:
+        self.area: str = area
+        self.random: random.Random = random.Random(seed)
+        self.start: datetime.date = start
+        self.quirks: bool = quirks
+        self.writer: PDFWriter = PDFWriter()
+        self.expected: list[Substitution] = []
+        self.y: float = PAGE_HEIGHT
+        # columns and header of the table being written, repeated after a page break with quirks
+        self.columns: list[int] = []
+        self.head: list[str] = []
+
+    @property
+    def is_it(self) -> bool:
+        return self.area == 'bs-it'
+
+    def __ensure_space(self, lines: int) -> bool:
+        """Starts a new page if the next lines don't fit, returns whether it did"""
+        if self.y + lines * LINE_HEIGHT <= PAGE_HEIGHT - MARGIN:
+            return False
+        self.writer.new_page()
+        self.y = MARGIN
+        return True
+
+    def __write(self, cells: list[Optional[str]]) -> None:
+        for x, cell in zip(self.columns, cells):
+            if cell:
+                self.writer.text(x, self.y, cell)
+        self.y += LINE_HEIGHT
+
+    def __row(self, cells: list[Optional[str]]) -> None:
+        if self.__ensure_space(1) and self.quirks:
+            self.__write(self.head)
+        self.__write(cells)
+
+    def __blank(self, cell: str) -> str:
+        return '' if self.quirks and self.random.random() < BLANK_RATE else cell
+
+    def __day(self, date: datetime.date, rows: int, classes: list[str]) -> None:
+        short_day, long_day = WEEKDAYS[date.weekday()]
+        date_text: str = date.strftime('%d.%m.%Y')
+        timestamp: int = round(datetime.datetime.strptime(date_text, '%d.%m.%Y').timestamp())
+        if not self.__ensure_space(4):
+            self.y += TABLE_GAP
+        title: str = f'Vertretungsplan {short_day} {date_text}' if self.is_it else f'{long_day} {date_text}'
+        self.writer.text(MARGIN, self.y, title)
+        self.y += LINE_HEIGHT + 4
+        shift: int = self.random.randrange(MAX_SHIFT + 1) if self.quirks else 0
+        self.columns = [x + shift for x in (IT_COLUMNS if self.is_it else OTHER_COLUMNS)]
+        self.head = IT_HEAD if self.is_it else OTHER_HEAD
+        self.__write(self.head)
+
+        slots: list[tuple[str, int]] = sorted(
+            self.random.sample([(group, lesson) for group in classes for lesson in range(1, 9)], rows)
+        )
+        for i, (group, lesson) in enumerate(slots):
+            teacher: str = self.__blank(self.random.choice(TEACHERS))
+            subject: str = self.random.choice(SUBJECTS)
+            room: str = self.__blank(self.random.choice(ROOMS))
+            notes: Optional[str] = self.random.choice(NOTES)
+            # some cells carry trailing dots, which the parser strips
+            teacher_cell: str = teacher + '.' if teacher and self.random.random() < 0.2 else teacher
+            if self.is_it:
+                # only the first row of a day repeats the date
+                self.__row([
+                    date_text if i == 0 else None, short_day if i == 0 else None, str(lesson), teacher_cell, subject,
+                    room, group, notes
+                ])
+            else:
+                self.__row([group, str(lesson), subject, room, teacher_cell, notes])
+            self.expected.append(Substitution(group, timestamp, lesson, teacher, subject, room, notes, self.area, True))
+
+    def generate(self, days: int, rows_per_day: int, class_count: int = 12) -> tuple[bytes, list[Substitution]]:
+        classes: list[str] = class_names(self.area, class_count)
+        rows_per_day = min(rows_per_day, class_count * 8)
+        date: datetime.date = self.start
+        for _ in range(days):
+            while date.weekday() >= 5:
+                date += datetime.timedelta(days=1)
+            self.__day(date, rows_per_day, classes)
+            date += datetime.timedelta(days=1)
+        return self.writer.to_bytes(), self.expected
+
+
+def generate_plan(
+    area: str, pages: int, seed: int = 0, class_count: int = 12, start: Optional[datetime.date] = None,
+    quirks: bool = False
+) -> tuple[bytes, list[Substitution]]:
+    """A plan of roughly the given number of pages, with five days spread evenly over them"""
+    rows_per_page: int = (PAGE_HEIGHT - 2 * MARGIN) // LINE_HEIGHT
+    days: int = 5
+    rows_per_day: int = max(1, pages * rows_per_page // days - 5)
+    generator: PlanGenerator = PlanGenerator(area, seed, start or START, quirks)
+    return generator.generate(days, rows_per_day, max(class_count, rows_per_day // 8 + 1))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('area')
+    parser.add_argument('pages', type=int)
+    parser.add_argument('out', type=Path)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--quirks', action='store_true', help='blank cells, repeated headers and shifted columns')
+    args = parser.parse_args()
+
+    content, expected = generate_plan(args.area, args.pages, args.seed, quirks=args.quirks)
+    args.out.write_bytes(content)
+    print(f'{args.out}: {len(content)} bytes, {len(expected)} substitutions')
+
+
+if __name__ == '__main__':
+    main()
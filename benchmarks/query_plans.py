@@ -0,0 +1,82 @@
+"""
+Applies the migrations to an empty database, runs the hot DB queries and checks with EXPLAIN QUERY PLAN
+that every table they touch is searched through the expected index instead of being scanned.
+The statements are captured while the real DB methods run, so the check follows changes to their SQL.
+Exits with 1 if any query plan doesn't, so it can guard changes to the queries and migrations.
+Usage: python -m benchmarks.query_plans [--verbose]
+"""
+import argparse
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+from typing import Callable
+
+from util.DB import DB
+
+# (name, call of the DB method, indexes its plan has to use)
+CASES: list[tuple[str, Callable[[], object], set[str]]] = [
+    ('pending users', lambda: DB.get_pending_notifications('tg'), {
+        'user_platform_gid', 'change_log_gid_seq', 'substitution_gid_day'
+    }),
+    ('pending users of classes', lambda: DB.get_pending_notifications('dc', ['IT 20/1', 'IT 20/2']), {
+        'user_platform_gid', 'change_log_gid_seq', 'substitution_gid_day'
+    }),
+    ('recent classes of an area', lambda: DB.get_all_recent_classes_for_area('bs-it'), {'class_area_last_update'}),
+    ('recent substitutions of a class', lambda: DB.get_recent_substitutions_for_class('IT 20/1'), {
+        'substitution_gid_day'
+    }),
+    ('user by uid and platform', lambda: DB.get_user_class_and_last_seq(1, 'dc'), {'sqlite_autoindex_user_1'}),
+    ('mark users updated', lambda: DB.mark_users_updated([1, 2], 1, 'dc'), {'sqlite_autoindex_user_1'}),
+]
+
+
+def capture(call: Callable[[], object]) -> list[str]:
+    """The select and update statements call runs, with their parameters filled in"""
+    statements: list[str] = []
+    DB.conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        DB.conn.set_trace_callback(None)
+    return [s for s in statements if s.lstrip().lower().startswith(('select', 'update'))]
+
+
+def check(call: Callable[[], object], indexes: set[str]) -> tuple[list[str], list[str]]:
+    """Returns the query plan lines and the problems found in them"""
+    plan: list[str] = []
+    for statement in capture(call):
+        plan += [row[3] for row in DB.conn.execute(f'explain query plan {statement}')]
+    problems: list[str] = [f'full scan: {line}' for line in plan if line.startswith('SCAN')]
+    used: str = '\n'.join(plan)
+    problems += [f'{index} not used' for index in sorted(indexes) if f'INDEX {index} ' not in used]
+    return plan, problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--verbose', action='store_true', help='print every query plan')
+    args = parser.parse_args()
+
+    failed: int = 0
+    with tempfile.TemporaryDirectory() as directory:
+        DB.init_db(Path(directory) / 'query_plans.db')
+        for name, call, indexes in CASES:
+            try:
+                plan, problems = check(call, indexes)
+            except sqlite3.Error as e:
+                plan, problems = [], [repr(e)]
+            print(f'{name:>32}: {"ok" if not problems else f"{len(problems)} problems"}')
+            for line in plan if args.verbose else []:
+                print(f'    {line}')
+            for problem in problems:
+                print(f'    {problem}')
+            failed += bool(problems)
+        DB.writer.shutdown()
+        DB.readers.shutdown()
+        DB.conn.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
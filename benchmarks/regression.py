@@ -0,0 +1,86 @@
+"""
+Parses a fixed set of generated plans and compares the result to the substitutions the generator wrote into them,
+then writes each plan into an empty database, which has to accept every row.
+Exits with 1 if any plan parses differently, so it can guard changes to the parsing pipeline.
+Usage: python -m benchmarks.regression [--backend NAME]
+"""
+import argparse
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from substitution_parsing.PDFHandling import PDF
+from substitution_parsing.ChangeSet import ChangeSet
+from substitution_parsing.Substitution import Substitution
+from util.DB import DB
+
+from .plan_generator import generate_plan
+
+# (area, pages, seed, quirks)
+CASES: list[tuple[str, int, int, bool]] = [
+    ('bs-it', 1, 1, False),
+    ('bs-it', 4, 2, False),
+    ('bs-it', 12, 3, False),
+    ('bgy', 1, 4, False),
+    ('bgy', 4, 5, False),
+    ('bs-et', 12, 6, False),
+    ('bs-it', 4, 7, True),
+    ('bs-it', 12, 8, True),
+    ('bgy', 4, 9, True),
+    ('bs-et', 12, 10, True),
+]
+
+
+def check(area: str, pages: int, seed: int, quirks: bool, backend: Optional[str]) -> list[str]:
+    """Returns the differences between the parsed and the expected substitutions"""
+    content, expected = generate_plan(area, pages, seed, quirks=quirks)
+    with PDF.from_bytes(content, area, backend) as pdf:
+        parsed: list[Substitution] = list(pdf.to_substitutions())
+        rejected = pdf.rejected
+    problems: list[str] = [f'rejected {row}' for row in rejected]
+    parsed_by_key: dict = {substitution.key: substitution for substitution in parsed}
+    expected_by_key: dict = {substitution.key: substitution for substitution in expected}
+    if len(parsed_by_key) != len(parsed):
+        problems.append(f'{len(parsed) - len(parsed_by_key)} duplicate substitutions')
+    for key, substitution in expected_by_key.items():
+        if key not in parsed_by_key:
+            problems.append(f'missing {substitution!r}')
+        elif parsed_by_key[key] != substitution:
+            problems.append(f'expected {substitution!r}, got {parsed_by_key[key]!r}')
+    for key in parsed_by_key.keys() - expected_by_key.keys():
+        problems.append(f'unexpected {parsed_by_key[key]!r}')
+    try:
+        changes: ChangeSet = DB.apply_plan(area, parsed)
+        if len(changes.inserted) != len(parsed_by_key):
+            problems.append(f'wrote {len(changes.inserted)} of {len(parsed_by_key)} substitutions')
+    except sqlite3.Error as e:
+        problems.append(f'writing the plan failed, {e!r}')
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--backend', help='defaults to PDF_BACKEND')
+    parser.add_argument('--verbose', action='store_true', help='list every difference')
+    args = parser.parse_args()
+
+    failed: int = 0
+    for area, pages, seed, quirks in CASES:
+        with tempfile.TemporaryDirectory() as directory:
+            DB.init_db(Path(directory) / 'regression.db')
+            problems: list[str] = check(area, pages, seed, quirks, args.backend)
+            DB.writer.shutdown()
+            DB.readers.shutdown()
+            DB.conn.close()
+        name: str = f'{area:>6} {pages:>3} pages{", quirks" if quirks else ""}:'
+        print(f'{name:<27} {"ok" if not problems else f"{len(problems)} differences"}')
+        for problem in problems if args.verbose else problems[:5]:
+            print(f'    {problem}')
+        failed += bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
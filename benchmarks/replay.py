@@ -0,0 +1,188 @@
+"""
+Replays an archive of plan revisions through the real ingest pipeline, against a local FakeServer,
+and measures per revision how long it took from being published to being ingested and to being notified.
+A notification round stands in for the bots: it renders every pending class like message_users does
+and marks the users updated, without sending anything. Every class gets one subscriber.
+Usage: python -m benchmarks.replay <archive> [--speed X] [--poll S | --adaptive [--warm]] [--notify-interval S]
+       [fault options]
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from substitution_parsing.CrawlState import CrawlState
+from substitution_parsing.Substitution import Substitution
+from substitution_parsing.fetcher import Fetcher
+from substitution_parsing.parse_pool import ParsePool
+from substitution_parsing.plan_cache import PlanCache
+from substitution_parsing.poll_scheduler import PollScheduler, WEEK
+from substitution_parsing.update_substitutions import update
+from util.DB import DB
+from util.message_cache import message_cache
+
+from .fake_server import Archive, FakeServer, Revision
+
+# passwords end in #<year>, like the real ones
+AUTH: tuple[str, str] = ('user', 'password#1')
+
+
+def format_line(substitution: Substitution) -> str:
+    return f'{substitution.day} {substitution.lesson}: {substitution.teacher} {substitution.subject} ' \
+        f'{substitution.room}'
+
+
+def notify_round(subscribed: set[str]) -> int:
+    """Subscribes a user to every new class and handles all pending notifications, returns the messages rendered"""
+    uid: int = len(subscribed)
+    for area in DB.get_areas():
+        for gid in DB.get_all_recent_classes_for_area(area):
+            if gid not in subscribed:
+                subscribed.add(gid)
+                uid += 1
+                DB.add_user(uid)
+                DB.add_user_to_class(uid, gid)
+                DB.update_user(uid, is_zero=True)
+    seq: int = DB.get_change_seq()
+    messages: int = 0
+    users: list[int] = []
+    versions: dict[str, int] = message_cache.versions()
+    for pending in DB.get_pending_notifications():
+        rendered = message_cache.get(pending.gid, 'tg', format_line, pending.substitutions, versions)
+        for uid, last_seq in pending.users:
+            if rendered.render(last_seq, lambda line: f'*{line}*'):
+                messages += 1
+                users.append(uid)
+    DB.mark_users_updated(users, seq)
+    return messages
+
+
+class Replay:
+    """Polls every poll recorded seconds, or as scheduled by scheduler if given"""
+
+    def __init__(
+        self, server: FakeServer, poll: float, notify_interval: float, scheduler: Optional[PollScheduler] = None
+    ) -> None:
+        self.server: FakeServer = server
+        self.poll: float = poll
+        self.notify_interval: float = notify_interval
+        self.scheduler: Optional[PollScheduler] = scheduler
+        # time.monotonic() of each stage per revision
+        self.ingested: dict[Revision, float] = {}
+        self.notified: dict[Revision, float] = {}
+        self.messages: int = 0
+
+    def __check_ingested(self, states: dict[str, CrawlState]) -> None:
+        now: float = time.monotonic()
+        for revision in self.server.archive.revisions:
+            state: Optional[CrawlState] = states.get(revision.plan)
+            if revision not in self.ingested and state and state.digest == revision.digest:
+                self.ingested[revision] = now
+
+    async def ingest(self, directory: Path, base_url: str) -> None:
+        states: dict[str, CrawlState] = {}
+        cache: PlanCache = PlanCache(directory / 'plan_cache')
+        with ParsePool(page_dir=cache.page_dir) as pool:
+            async with Fetcher(timeout=10.0, base_url=base_url) as fetcher:
+                while True:
+                    changed: Optional[dict[str, int]] = await update(fetcher, pool, cache, states)
+                    self.__check_ingested(states)
+                    delay: float = self.poll
+                    if self.scheduler:
+                        if changed is None:
+                            self.scheduler.failed()
+                        else:
+                            self.scheduler.succeeded()
+                            self.scheduler.record(changed.values())
+                        delay = self.scheduler.next_delay(self.server.archive.start + self.server.offset)
+                    await asyncio.sleep(delay / self.server.speed)
+
+    async def notify(self) -> None:
+        subscribed: set[str] = set()
+        while True:
+            started: float = time.monotonic()
+            self.messages += await DB.write(notify_round, subscribed)
+            finished: float = time.monotonic()
+            # a round covers everything that was ingested before it started
+            for revision, ingested in self.ingested.items():
+                if revision not in self.notified and ingested <= started:
+                    self.notified[revision] = finished
+            await asyncio.sleep(self.notify_interval / self.server.speed)
+
+    def report(self) -> None:
+        revisions: list[Revision] = self.server.archive.revisions
+        print(f'{len(revisions)} revisions, {len(self.ingested)} ingested, {len(self.notified)} notified, '
+              f'{self.messages} messages rendered')
+        print(f'responses: {dict(self.server.responses)}')
+        for stage, times in (('ingest', self.ingested), ('notify', self.notified)):
+            latencies: list[float] = sorted(times[r] - self.server.published_at(r) for r in revisions if r in times)
+            if not latencies:
+                continue
+            p50: float = statistics.median(latencies)
+            p99: float = latencies[min(len(latencies) - 1, round(len(latencies) * 0.99))]
+            print(
+                f'{stage:>7}: p50 {p50:7.2f} s, p99 {p99:7.2f} s, max {latencies[-1]:7.2f} s '
+                f'(recorded time: p50 {p50 * self.server.speed / 60:7.1f} min)'
+            )
+
+
+async def replay(args: argparse.Namespace) -> None:
+    archive: Archive = Archive(args.archive)
+    server: FakeServer = FakeServer(
+        archive, AUTH, True, args.speed, args.latency, args.error_rate, args.stall_rate, stall=15.0,
+        touch_interval=args.touch_interval, seed=0
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        DB.init_db(Path(directory) / 'replay.db')
+        DB.add_new_credential(*AUTH)
+        scheduler: Optional[PollScheduler] = None
+        if args.adaptive:
+            # with warm, the scheduler starts out knowing the recording, as if it had happened the week before
+            history: list[int] = [
+                round(archive.start + revision.offset - WEEK) for revision in archive.revisions
+            ] if args.warm else []
+            scheduler = PollScheduler(history)
+            print(scheduler.describe(archive.start))
+        harness: Replay = Replay(server, args.poll, args.notify_interval, scheduler)
+        await server.start(port=args.port)
+        tasks: list[asyncio.Task] = [
+            asyncio.create_task(harness.ingest(Path(directory), f'http://localhost:{args.port}')),
+            asyncio.create_task(harness.notify()),
+        ]
+        print(f'replaying {archive.duration / 60 / 60:.1f} hours of recording in '
+              f'{archive.duration / args.speed:.0f} seconds')
+        while not server.finished:
+            await asyncio.sleep(1.0)
+        # give the last revisions time to get through
+        await asyncio.sleep((args.poll + args.notify_interval) / args.speed + 5.0)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await server.stop()
+        harness.report()
+        DB.writer.shutdown()
+        DB.readers.shutdown()
+        DB.conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('archive', type=Path)
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--speed', type=float, default=3600.0, help='recorded seconds per real second')
+    parser.add_argument('--poll', type=float, default=5 * 60, help='recorded seconds between listing polls')
+    parser.add_argument('--notify-interval', type=float, default=60, help='recorded seconds between notifications')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--stall-rate', type=float, default=0.0)
+    parser.add_argument('--touch-interval', type=float)
+    parser.add_argument('--adaptive', action='store_true', help='poll as scheduled by PollScheduler')
+    parser.add_argument('--warm', action='store_true', help='train the scheduler on the archive first')
+    asyncio.run(replay(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,17 @@ from datetime import datetime
 from os import getenv
 import asyncio
 from logging import info
+from typing import Optional
 
 import discord
-from discord.errors import Forbidden
+from discord.errors import Forbidden, HTTPException
 from discord.ext import tasks
 from discord import app_commands
+from substitution_parsing.Substitution import Substitution
 from util.DB import DB
 from util import check_credentials
+from util.dispatcher import Dispatcher
+from util.notifier import Notifier
 
 
 intents = discord.Intents.default()
@@ -19,6 +23,16 @@ tree = app_commands.CommandTree(client)
 DISCORD: str = "dc"
 
 
+def retry_after(e: Exception) -> Optional[float]:
+    if isinstance(e, HTTPException) and e.status == 429:
+        return float(e.response.headers.get('Retry-After', 1))
+    return None
+
+
+# discord limits: 50 requests per second overall and 5 messages per 5 seconds per channel
+dispatcher: Dispatcher = Dispatcher('discord', 50.0, 1.0, per_chat_burst=5.0, retry_after=retry_after)
+
+
 @tree.command(description="Verifiziere dass du die Zugangsdaten kennst")
 @app_commands.describe(
     username="Nutzername für geschuetzt.bszet.de",
@@ -36,12 +50,14 @@ async def verify(interaction: discord.Interaction, username: str, password: str)
             "Initialisieren fehlgeschlagen. Stelle sicher, dass der Bot im Channel schreiben darf."
             )
         return
-    DB.add_user(interaction.channel_id, platform=DISCORD)
-    if check_credentials(username, password):
-        DB.trust_user(interaction.channel_id, platform=DISCORD)
-        await interaction.response.send_message("Erfolgreich verifiziert. Du kannst nun eine Klasse mit /set_class setzen")
+    await DB.write(DB.add_user, interaction.channel_id, platform=DISCORD)
+    # the check can take longer than discord waits for a response
+    await interaction.response.defer(thinking=True)
+    if await check_credentials(username, password):
+        await DB.write(DB.trust_user, interaction.channel_id, platform=DISCORD)
+        await interaction.followup.send("Erfolgreich verifiziert. Du kannst nun eine Klasse mit /set_class setzen")
     else:
-        await interaction.response.sent_message("Ungültige Zugangsdaten")
+        await interaction.followup.send("Ungültige Zugangsdaten")
 
 
 @tree.command(description="Setze eine Klasse, für die Vertretungen gesendet werden sollen")
@@ -57,21 +73,21 @@ async def verify(interaction: discord.Interaction, username: str, password: str)
     class_name="Klassenname"
 )
 async def set_class(interaction: discord.Interaction, area: app_commands.Choice[str], class_name: str):
-    if not DB.is_trusted_user(interaction.channel_id, platform=DISCORD):
+    if not await DB.read(DB.is_trusted_user, interaction.channel_id, platform=DISCORD):
         await interaction.response.send_message("Bitte verifiziere dich erst mit /verify")
         return
-    if not DB.check_if_class_exists(area.value, class_name):
+    if not await DB.read(DB.check_if_class_exists, area.value, class_name):
         await interaction.response.send_message("Die Klasse wurde leider nicht für den Bereich gefunden.")
         return
-    DB.add_user_to_class(interaction.channel_id, class_name, platform=DISCORD)
-    DB.update_user(interaction.channel_id, is_zero=True, platform=DISCORD)
+    await DB.write(DB.add_user_to_class, interaction.channel_id, class_name, platform=DISCORD)
+    await DB.write(DB.update_user, interaction.channel_id, is_zero=True, platform=DISCORD)
     await interaction.response.send_message(f"Erfolgreich Klasse {class_name} in Bereich {area.name} gesetzt.")
-    await update_channel(interaction.channel_id)
+    await notifier.update_user(interaction.channel_id)
 
 
 @tree.command(description="Stoppe den bot in diesem Kanal")
 async def stop(interaction: discord.Interaction):
-    DB.delete_user(interaction.channel_id, platform=DISCORD)
+    await DB.write(DB.delete_user, interaction.channel_id, platform=DISCORD)
     await interaction.response.send_message("Erfolgreich gestoppt")
 
 
@@ -81,40 +97,45 @@ async def get_channel(cid: int) -> discord.TextChannel | discord.DMChannel:
     return await client.fetch_channel(cid)
 
 
-async def update_channel(cid: int):
-    info(f"Updating substitutions for discord channel {cid}")
-    result: str = 'Aktuelle Vertretungen:\n\n'
-    is_new: bool = False
-    for substitution in DB.get_all_substitutions_for_user(cid, platform=DISCORD):
-        line: str = datetime.fromtimestamp(substitution.day).strftime('%a, %d.%m')
-        line += f', {substitution.lesson}: {substitution.teacher} {substitution.subject} {substitution.room}'
-        if substitution.notes:
-            line += f' ({substitution.notes})'
-        if substitution.is_new:
-            line = f'**{line}**'
-            is_new = True
-        result += line + '\n'
-    if is_new:
-        try:
-            channel: discord.TextChannel | discord.DMChannel = await get_channel(cid)
-            await channel.send(result)
-            DB.update_user(cid, platform=DISCORD)
-        except Forbidden:
-            DB.delete_user(cid, platform=DISCORD)
-
-
-@tasks.loop(minutes=1.0, reconnect=True)
+def format_line(substitution: Substitution) -> str:
+    line: str = datetime.fromtimestamp(substitution.day).strftime('%a, %d.%m')
+    line += f', {substitution.lesson}: {substitution.teacher} {substitution.subject} {substitution.room}'
+    if substitution.notes:
+        line += f' ({substitution.notes})'
+    return line
+
+
+def bold(line: str) -> str:
+    return f'**{line}**'
+
+
+async def send_update(cid: int, text: str) -> bool:
+    try:
+        channel: discord.TextChannel | discord.DMChannel = await get_channel(cid)
+        await channel.send(text)
+    except Forbidden:
+        return False
+    return True
+
+
+notifier: Notifier = Notifier(DISCORD, dispatcher, send_update, format_line, bold)
+
+
+@tasks.loop(minutes=15.0, reconnect=True)
 async def update_channels():
+    """Safety net for changes that weren't published on the event bus, e.g. because of a restart"""
     info("updating discord channels")
-    for cid in DB.get_all_updated_users(DISCORD):
-        await update_channel(cid)
+    await notifier.notify()
 
 
 @client.event
 async def on_ready():
     await tree.sync()
     info("discord bot ready")
-    update_channels.start()
+    if not update_channels.is_running():
+        update_channels.change_interval(seconds=float(getenv('NOTIFY_POLL_INTERVAL', '900')))
+        update_channels.start()
+        client.loop.create_task(notifier.listen())
 
 
 async def main():
@@ -6,6 +6,7 @@ from dotenv import load_dotenv
 import discord
 
 from util.DB import DB
+from util.metrics import serve_metrics
 from substitution_parsing import update_substitutions
 from tg_bot import tg_bot
 from dc_bot import dc_bot
@@ -15,6 +16,8 @@ async def main():
     load_dotenv()
     DB.init_db(Path(getenv('DATABASE_FILE')))
     futures = [update_substitutions.continuous_update()]
+    if getenv('METRICS_PORT'):
+        futures.append(serve_metrics(int(getenv('METRICS_PORT')), getenv('METRICS_HOST') or '127.0.0.1'))
     discord.utils.setup_logging()
     if getenv('BOT_API_TOKEN'):
         futures.append(tg_bot.main())
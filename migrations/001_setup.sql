@@ -32,3 +32,11 @@ create table if not exists substitution (
     last_update int not null default (strftime('%s', 'now')),
     unique (day, lesson, gid)
 );
+
+create table if not exists crawl_state (
+    plan text primary key,
+    listing_modified int not null default 0,
+    digest text,
+    parse_duration real not null default 0,
+    row_count int not null default 0
+);
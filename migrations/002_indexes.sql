@@ -0,0 +1,22 @@
+-- discord channel ids and telegram user ids can collide, so users are identified by both
+create table user_new (
+    uid int not null,
+    platform text not null default 'tg',
+    gid text references class on delete cascade,
+    trusted int not null default 0,
+    last_update int not null default (strftime('%s', 'now')),
+    primary key (uid, platform)
+);
+insert into user_new (uid, platform, gid, trusted, last_update)
+    select uid, platform, gid, trusted, last_update from user;
+drop table user;
+alter table user_new rename to user;
+
+-- pending notifications: users of a platform per class and their last notification
+create index if not exists user_platform_gid on user (platform, gid, last_update, uid);
+-- pending notifications: has a class changed since a user's last notification
+create index if not exists substitution_gid_last_update on substitution (gid, last_update, day);
+-- recent substitutions of a class in display order
+create index if not exists substitution_gid_day on substitution (gid, day, lesson);
+-- recent classes of an area
+create index if not exists class_area_last_update on class (area, last_update, gid);
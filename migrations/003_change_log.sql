@@ -0,0 +1,22 @@
+-- every insert and update of a substitution, in order. autoincrement, so compaction never causes a seq to be reused
+create table if not exists change_log (
+    seq integer primary key autoincrement,
+    gid text not null references class on delete cascade,
+    day int not null,
+    lesson int not null,
+    created int not null default (strftime('%s', 'now'))
+);
+-- seq of the last change of a substitution, for highlighting
+alter table substitution add column seq int not null default 0;
+-- last seq a user was notified about. Existing users have seen everything that happened before the log existed.
+alter table user add column last_seq int not null default 0;
+
+-- pending notifications: has a class changed since a user's last notification
+create index if not exists change_log_gid_seq on change_log (gid, seq, day);
+-- compaction of the change log
+create index if not exists change_log_created on change_log (created);
+-- pending notifications: users of a platform per class and their last notification
+drop index if exists user_platform_gid;
+create index if not exists user_platform_gid on user (platform, gid, last_seq, uid);
+-- replaced by the change log
+drop index if exists substitution_gid_last_update;
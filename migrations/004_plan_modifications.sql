@@ -0,0 +1,7 @@
+-- listing timestamps of all observed plan changes, the poll scheduler learns when plans usually change from them
+create table if not exists plan_modification (
+    plan text not null,
+    modified int not null,
+    primary key (plan, modified)
+);
+create index if not exists plan_modification_modified on plan_modification (modified);
@@ -0,0 +1,27 @@
+from .Substitution import Substitution
+
+
+class ChangeSet:
+    """The rows a single plan write inserted, updated and removed"""
+
+    def __init__(
+        self, inserted: list[Substitution], updated: list[Substitution], removed: list[Substitution]
+    ) -> None:
+        self.inserted: list[Substitution] = inserted
+        self.updated: list[Substitution] = updated
+        self.removed: list[Substitution] = removed
+
+    @property
+    def changed_classes(self) -> set[str]:
+        return {s.group for s in self.inserted + self.updated + self.removed}
+
+    def __bool__(self) -> bool:
+        return bool(self.inserted or self.updated or self.removed)
+
+    def __repr__(self) -> str:
+        return (
+            f'ChangeSet('
+            f'inserted={len(self.inserted)}, '
+            f'updated={len(self.updated)}, '
+            f'removed={len(self.removed)})'
+        )
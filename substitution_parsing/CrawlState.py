@@ -0,0 +1,23 @@
+from typing import Optional
+
+
+class CrawlState:
+    def __init__(
+        self, plan: str, listing_modified: int = 0, digest: Optional[str] = None, parse_duration: float = 0.0,
+        row_count: int = 0
+    ) -> None:
+        self.plan: str = plan
+        self.listing_modified: int = listing_modified
+        self.digest: Optional[str] = digest
+        self.parse_duration: float = parse_duration
+        self.row_count: int = row_count
+
+    def __repr__(self) -> str:
+        return (
+            f'CrawlState('
+            f'plan={self.plan!r}, '
+            f'listing_modified={self.listing_modified!r}, '
+            f'digest={self.digest!r}, '
+            f'parse_duration={self.parse_duration!r}, '
+            f'row_count={self.row_count!r})'
+        )
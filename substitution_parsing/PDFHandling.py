@@ -1,97 +1,171 @@
 from __future__ import annotations
 
 import datetime
-import io
 import re
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
-
-from PyPDF2 import PdfReader
+from typing import Iterator, Optional
 
 from .Substitution import Substitution
-from .table_parser import parse_tables, Table
+from .extraction import ExtractionBackend, get_backend
+from .page_cache import PageCache
+from .table_parser import iter_tables, Table
 
 DOT_REGEX: re.Pattern = re.compile(r'\.+$')
 
 
+class RejectedRow:
+    """A row that couldn't be turned into a substitution"""
+
+    def __init__(self, table: Optional[str], row: list[Optional[str]], reason: str) -> None:
+        self.table: Optional[str] = table
+        self.row: list[Optional[str]] = row
+        self.reason: str = reason
+
+    def __repr__(self) -> str:
+        return f'RejectedRow(table={self.table!r}, row={self.row!r}, reason={self.reason!r})'
+
+
+def strip_dots(column: list[Optional[str]]) -> list[Optional[str]]:
+    return [DOT_REGEX.sub('', cell) if cell and cell[-1] == '.' else cell for cell in column]
+
+
+def forward_fill_dates(dates: list[Optional[str]], days: list[Optional[str]]) -> None:
+    """Rows without a date, and repeated headers, belong to the date of the row above"""
+    last_date: str = ''
+    last_day: str = ''
+    for i, date in enumerate(dates):
+        if date and 'Klasse' not in date:
+            last_date = date
+            last_day = days[i]
+        else:
+            dates[i] = last_date
+            days[i] = last_day
+
+
+@lru_cache(maxsize=1024)
+def parse_date(value: str) -> Optional[int]:
+    try:
+        return round(datetime.datetime.strptime(value, '%d.%m.%Y').timestamp())
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=1024)
+def parse_lesson(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
 class PDF:
-    def __init__(self, reader: PdfReader, area: str):
-        self.reader: PdfReader = reader
-        self.tables: list[Table] = parse_tables(reader)
+    """
+    Parses lazily, one page at a time, while iterating over iter_tables or to_substitutions.
+    Close it, or use it as a context manager, to release the underlying file.
+    """
+
+    def __init__(self, backend: ExtractionBackend, area: str, page_cache: Optional[PageCache] = None):
+        self.backend: ExtractionBackend = backend
         self.area: str = area
-        self.__cleanup_tables()
+        self.page_cache: Optional[PageCache] = page_cache
+        # rows that couldn't be converted by the last to_substitutions
+        self.rejected: list[RejectedRow] = []
+
+    def __enter__(self) -> PDF:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.backend.close()
+
+    def tables(self) -> list[Table]:
+        """Extracts all tables again on every call"""
+        return list(self.iter_tables())
 
     @staticmethod
-    def __remove_dots_from_row(row: list[Optional[str]]):
-        for i, cell in enumerate(row):
-            if cell:
-                row[i] = DOT_REGEX.sub('', cell)
-
-    def __cleanup_tables(self):
-        for table in self.tables:
-            PDF.__remove_dots_from_row(table.head)
-            last_date: str = ''
-            last_day: str = ''
-            for row in table.rows:
-                PDF.__remove_dots_from_row(row)
-                if row[0] and 'Klasse' not in row[0]:
-                    last_date = row[0]
-                    last_day = row[1]
+    def __cleanup_table(table: Table):
+        table.head = strip_dots(table.head)
+        table.columns = [strip_dots(column) for column in table.columns]
+        # tables that continue on the next page repeat their header there
+        rows: list[tuple[Optional[str], ...]] = list(zip(*table.columns))
+        if any(list(row) == table.head for row in rows):
+            kept: list[tuple[Optional[str], ...]] = [row for row in rows if list(row) != table.head]
+            table.columns = [list(column) for column in zip(*kept)] if kept else [[] for _ in table.columns]
+        if len(table.columns) >= 2:
+            forward_fill_dates(table.columns[0], table.columns[1])
+
+    def iter_tables(self) -> Iterator[Table]:
+        for table in iter_tables(self.backend, self.page_cache):
+            PDF.__cleanup_table(table)
+            yield table
+
+    def __reject(self, table: Table, row: int, reason: str) -> None:
+        self.rejected.append(RejectedRow(table.title, [column[row] for column in table.columns], reason))
+
+    def __to_it_substitutions(self) -> Iterator[Substitution]:
+        for table in self.iter_tables():
+            columns: list[list[Optional[str]]] = table.columns
+            if len(columns) < 8:
+                for i in range(table.row_count):
+                    self.__reject(table, i, f'expected 8 columns, got {len(columns)}')
+                continue
+            days: list[Optional[int]] = [parse_date(value) for value in columns[0]]
+            lessons: list[Optional[int]] = [parse_lesson(value) for value in columns[2]]
+            for i, (day, lesson) in enumerate(zip(days, lessons)):
+                if day is None:
+                    self.__reject(table, i, 'invalid date')
+                elif lesson is None:
+                    self.__reject(table, i, 'invalid lesson')
+                elif not columns[6][i]:
+                    self.__reject(table, i, 'missing class')
                 else:
-                    row[0] = last_date
-                    row[1] = last_day
-
-    def __to_it_substitutions(self) -> list[Substitution]:
-        substitutions: list[Substitution] = []
-        for table in self.tables:
-            for row in table.rows:
-                try:
-                    date: datetime.datetime = datetime.datetime.strptime(row[0], '%d.%m.%Y')
-                    substitutions.append(
-                        Substitution(
-                            row[6],
-                            round(date.timestamp()),
-                            int(row[2]),
-                            row[3],
-                            row[4],
-                            row[5],
-                            row[7],
-                            self.area,
-                            True,
-                        )
+                    # blank cells are stored empty, the database doesn't accept null for them
+                    yield Substitution(
+                        columns[6][i], day, lesson, columns[3][i] or '', columns[4][i] or '', columns[5][i] or '',
+                        columns[7][i], self.area, True
                     )
-                except ValueError:
-                    print(row[0])
-                    ...  # invalid entry
-        return substitutions
-
-    def __to_other_substitutions(self) -> list[Substitution]:
-        substitutions: list[Substitution] = []
-        for table in self.tables:
-            date: datetime.datetime = datetime.datetime.strptime(table.title.split(' ')[1], '%d.%m.%Y')
-            timestamp: int = round(date.timestamp())
-            for row in table.rows:
-                if 'Klasse' in row[0]:
+
+    def __to_other_substitutions(self) -> Iterator[Substitution]:
+        for table in self.iter_tables():
+            columns: list[list[Optional[str]]] = table.columns
+            title_parts: list[str] = (table.title or '').split(' ')
+            day: Optional[int] = parse_date(title_parts[1]) if len(title_parts) > 1 else None
+            if day is None or len(columns) < 6:
+                reason: str = 'invalid table title' if day is None else f'expected 6 columns, got {len(columns)}'
+                for i in range(table.row_count):
+                    self.__reject(table, i, reason)
+                continue
+            lessons: list[Optional[int]] = [parse_lesson(value or '0') for value in columns[1]]
+            for i, lesson in enumerate(lessons):
+                if not columns[0][i]:
+                    self.__reject(table, i, 'missing class')
                     continue
-                substitutions.append(
-                    Substitution(row[0], timestamp, int(row[1] or 0), row[4] or '', row[2] or '', row[3] or '', row[5],
-                                 self.area, True)
+                if 'Klasse' in columns[0][i]:
+                    continue
+                if lesson is None:
+                    self.__reject(table, i, 'invalid lesson')
+                    continue
+                yield Substitution(
+                    columns[0][i], day, lesson, columns[4][i] or '', columns[2][i] or '', columns[3][i] or '',
+                    columns[5][i], self.area, True
                 )
-        return substitutions
 
-    def to_substitutions(self) -> list[Substitution]:
+    def to_substitutions(self) -> Iterator[Substitution]:
+        self.rejected = []
         if self.area == 'bs-it':
             return self.__to_it_substitutions()
         return self.__to_other_substitutions()
 
     @staticmethod
-    def from_file(file: Path, area: str) -> PDF:
-        reader: PdfReader = PdfReader(file)
-        return PDF(reader, area)
+    def from_file(
+        file: Path, area: str, page_cache: Optional[PageCache] = None, backend: Optional[str] = None
+    ) -> PDF:
+        """backend defaults to the one selected with PDF_BACKEND"""
+        return PDF(get_backend(backend).from_file(file), area, page_cache)
 
     @staticmethod
-    def from_bytes(content: bytes, area: str) -> PDF:
-        with io.BytesIO(content) as pdf_file:
-            reader: PdfReader = PdfReader(pdf_file)
-            return PDF(reader, area)
-
+    def from_bytes(content: bytes, area: str, backend: Optional[str] = None) -> PDF:
+        return PDF(get_backend(backend).from_bytes(content), area)
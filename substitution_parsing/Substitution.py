@@ -1,20 +1,75 @@
+from sys import intern
 from typing import Optional
 
 
+def intern_optional(value: Optional[str]) -> Optional[str]:
+    return intern(value) if value is not None else None
+
+
 class Substitution:
+    """
+    Immutable and slotted, as plans and query results hold thousands of them.
+    The low cardinality string fields are interned, so equal values share one object.
+    """
+    __slots__ = ('group', 'day', 'lesson', 'teacher', 'subject', 'room', 'notes', 'area', 'is_new')
+
+    group: str
+    day: int
+    lesson: int
+    teacher: str
+    subject: str
+    room: str
+    notes: Optional[str]
+    area: str
+    is_new: bool
+
     def __init__(
         self, group: str, day: int, lesson: int, teacher: str, subject: str, room: str, notes: Optional[str], area: str,
         is_new: bool
     ) -> None:
-        self.group: str = group
-        self.day: int = day
-        self.lesson: int = lesson
-        self.teacher: str = teacher
-        self.subject: str = subject
-        self.room: str = room
-        self.notes: Optional[str] = notes
-        self.area: str = area
-        self.is_new: bool = is_new
+        init = object.__setattr__
+        init(self, 'group', intern_optional(group))
+        init(self, 'day', day)
+        init(self, 'lesson', lesson)
+        init(self, 'teacher', intern_optional(teacher))
+        init(self, 'subject', intern_optional(subject))
+        init(self, 'room', intern_optional(room))
+        init(self, 'notes', notes)
+        init(self, 'area', intern_optional(area))
+        init(self, 'is_new', is_new)
+
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError(f'Substitution is immutable, can\'t set {name}')
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f'Substitution is immutable, can\'t delete {name}')
+
+    @property
+    def key(self) -> tuple[str, int, int]:
+        """Identifies the slot of a substitution, a class has at most one per lesson"""
+        return self.group, self.day, self.lesson
+
+    @property
+    def content(self) -> tuple[str, str, str, Optional[str]]:
+        """Everything that can change for the same key"""
+        return self.teacher, self.subject, self.room, self.notes
+
+    def __astuple(self) -> tuple:
+        return (
+            self.group, self.day, self.lesson, self.teacher, self.subject, self.room, self.notes, self.area, self.is_new
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Substitution):
+            return NotImplemented
+        return self.__astuple() == other.__astuple()
+
+    def __hash__(self) -> int:
+        return hash(self.__astuple())
+
+    def __reduce__(self):
+        # the default pickling of slots would go through __setattr__
+        return Substitution, self.__astuple()
 
     def __repr__(self) -> str:
         return (
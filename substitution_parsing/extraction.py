@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import mmap
+from abc import ABC, abstractmethod
+from os import getenv
+from pathlib import Path
+from typing import Iterator, Optional
+
+from PyPDF2 import PageObject, PdfReader
+
+# (y, x, text), y grows downwards and is relative to the bottom of the page
+Fragment = tuple[float, float, str]
+Elements = list[Fragment]
+
+
+class BackendPage(ABC):
+    height: float
+
+    @abstractmethod
+    def digest(self) -> str:
+        """Identifies the page's content, for the page cache"""
+
+    @abstractmethod
+    def fragments(self) -> Elements:
+        ...
+
+
+class ExtractionBackend(ABC):
+    """Turns the pages of a pdf into positioned text fragments for table_parser"""
+    name: str
+
+    @abstractmethod
+    def pages(self) -> Iterator[BackendPage]:
+        ...
+
+    @abstractmethod
+    def close(self) -> None:
+        ...
+
+
+def create_visitor(elements: Elements):
+    def visitor(text: str, cm, tm, *_):
+        text = text.strip()
+        if not text:
+            return
+        x: float = cm[4]
+        y: float = -cm[5]
+        if tm[5] < 1000:
+            x += tm[4]
+            y += tm[5]
+        elements.append((y, x, text))
+
+    return visitor
+
+
+class PyPDF2Page(BackendPage):
+    def __init__(self, page: PageObject) -> None:
+        self.page: PageObject = page
+        self.height: float = float(page.mediabox.height)
+
+    def digest(self) -> str:
+        contents = self.page.get_contents()
+        data: bytes = contents.get_data() if contents is not None else b''
+        return hashlib.sha256(b'pypdf2' + data + str(self.page.mediabox).encode()).hexdigest()
+
+    def fragments(self) -> Elements:
+        elements: Elements = []
+        self.page.extract_text(visitor_text=create_visitor(elements))
+        return elements
+
+
+class PyPDF2Backend(ExtractionBackend):
+    name = 'pypdf2'
+
+    def __init__(self, reader: PdfReader) -> None:
+        self.reader: PdfReader = reader
+
+    @staticmethod
+    def from_file(file: Path) -> PyPDF2Backend:
+        """Maps the file into memory instead of reading it into a copy first"""
+        with file.open('rb') as f:
+            # the mapping stays valid after the file is closed
+            pdf_file: mmap.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return PyPDF2Backend(PdfReader(pdf_file))
+
+    @staticmethod
+    def from_bytes(content: bytes) -> PyPDF2Backend:
+        return PyPDF2Backend(PdfReader(io.BytesIO(content)))
+
+    def pages(self) -> Iterator[BackendPage]:
+        for page in self.reader.pages:
+            yield PyPDF2Page(page)
+
+    def close(self) -> None:
+        self.reader.stream.close()
+
+
+class PyMuPDFPage(BackendPage):
+    def __init__(self, page) -> None:
+        self.page = page
+        self.height: float = float(page.rect.height)
+
+    def digest(self) -> str:
+        return hashlib.sha256(b'pymupdf' + self.page.read_contents() + str(self.page.rect).encode()).hexdigest()
+
+    def fragments(self) -> Elements:
+        # spans are runs of text in the same font, the closest thing to the text runs PyPDF2 reports
+        elements: Elements = []
+        for block in self.page.get_text('dict')['blocks']:
+            for line in block.get('lines', ()):
+                for span in line['spans']:
+                    text: str = span['text'].strip()
+                    if text:
+                        x, y = span['origin']
+                        elements.append((y - self.height, x, text))
+        return elements
+
+
+class PyMuPDFBackend(ExtractionBackend):
+    """Needs the optional pymupdf package, it's several times faster than PyPDF2"""
+    name = 'pymupdf'
+
+    def __init__(self, document) -> None:
+        self.document = document
+
+    @staticmethod
+    def from_file(file: Path) -> PyMuPDFBackend:
+        import fitz
+        return PyMuPDFBackend(fitz.open(file))
+
+    @staticmethod
+    def from_bytes(content: bytes) -> PyMuPDFBackend:
+        import fitz
+        return PyMuPDFBackend(fitz.open(stream=content, filetype='pdf'))
+
+    def pages(self) -> Iterator[BackendPage]:
+        for page in self.document:
+            yield PyMuPDFPage(page)
+
+    def close(self) -> None:
+        self.document.close()
+
+
+BACKENDS: dict[str, type[PyPDF2Backend] | type[PyMuPDFBackend]] = {
+    PyPDF2Backend.name: PyPDF2Backend,
+    PyMuPDFBackend.name: PyMuPDFBackend,
+}
+
+
+def get_backend(name: Optional[str] = None) -> type[PyPDF2Backend] | type[PyMuPDFBackend]:
+    """The backend called name, by default the one selected with PDF_BACKEND"""
+    name = name or getenv('PDF_BACKEND', PyPDF2Backend.name)
+    if name not in BACKENDS:
+        raise ValueError(f'unknown pdf backend {name!r}, available: {", ".join(BACKENDS)}')
+    return BACKENDS[name]
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from logging import info, warning
+from typing import Optional
+
+import aiohttp
+
+from util.metrics import SIZE_BUCKETS, Counter, Histogram, metrics
+from .plan_cache import PlanCache
+
+BASE_URL: str = 'https://geschuetzt.bszet.de'
+LISTING_PATH: str = 'index.php?dir=/Vertretungsplaene'
+
+LISTING_FETCH: Histogram = metrics.histogram('bszet_listing_fetch_seconds', 'Time to fetch the directory listing')
+FETCH_FAILURES: Counter = metrics.counter(
+    'bszet_fetch_failures_total', 'Failed requests to the plan server', ('kind',)
+)
+PLAN_DOWNLOAD: Histogram = metrics.histogram(
+    'bszet_plan_download_seconds', 'Time to download a substitution plan', ('status',)
+)
+PLAN_SIZE: Histogram = metrics.histogram(
+    'bszet_plan_download_bytes', 'Size of the downloaded substitution plans', buckets=SIZE_BUCKETS
+)
+
+
+class FetchResult:
+    def __init__(
+        self, status: int, content: bytes, etag: Optional[str] = None, last_modified: Optional[str] = None
+    ) -> None:
+        self.status: int = status
+        self.content: bytes = content
+        self.etag: Optional[str] = etag
+        self.last_modified: Optional[str] = last_modified
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status == 304
+
+
+class Fetcher:
+    """
+    Pooled, keep-alive http client for geschuetzt.bszet.de that never blocks the event loop.
+    Use as an async context manager, the session is closed on exit.
+    """
+
+    def __init__(self, timeout: float = 30.0, max_connections: int = 4, base_url: str = BASE_URL):
+        self.timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(total=timeout, sock_connect=10.0)
+        self.max_connections: int = max_connections
+        self.base_url: str = base_url.rstrip('/')
+        self.__session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> Fetcher:
+        connector: aiohttp.TCPConnector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60.0)
+        self.__session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        if self.__session:
+            await self.__session.close()
+            self.__session = None
+
+    async def get(
+        self, path: str, auth: tuple[str, str], headers: Optional[dict[str, str]] = None
+    ) -> Optional[FetchResult]:
+        try:
+            async with self.__session.get(
+                f'{self.base_url}/{path}', auth=aiohttp.BasicAuth(*auth), headers=headers
+            ) as resp:
+                content: bytes = await resp.read()
+                if resp.status not in (200, 304):
+                    warning(f'Error fetching {path}, status {resp.status}')
+                    return None
+                return FetchResult(resp.status, content, resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            warning(f'Error fetching {path}, {e!r}')
+            return None
+
+    async def get_listing(self, auth: tuple[str, str]) -> Optional[bytes]:
+        with LISTING_FETCH.time():
+            result: Optional[FetchResult] = await self.get(LISTING_PATH, auth)
+        if result is None:
+            FETCH_FAILURES.inc(kind='listing')
+            return None
+        return result.content
+
+    async def get_plan(
+        self, plan: str, auth: tuple[str, str], validators: Optional[dict[str, str]]
+    ) -> Optional[FetchResult]:
+        start: float = time.perf_counter()
+        result: Optional[FetchResult] = await self.get(plan, auth, validators)
+        if result is None:
+            FETCH_FAILURES.inc(kind='plan')
+            return None
+        PLAN_DOWNLOAD.observe(time.perf_counter() - start, status=str(result.status))
+        if not result.not_modified:
+            PLAN_SIZE.observe(len(result.content))
+        return result
+
+    async def get_plans(
+        self, plans: set[str], auth: tuple[str, str], cache: PlanCache
+    ) -> dict[str, Optional[FetchResult]]:
+        """Downloads all plans concurrently, sending the cached validators so unchanged plans answer 304."""
+        info(f'downloading {len(plans)} substitution plans')
+        ordered: list[str] = sorted(plans)
+        results: list[Optional[FetchResult]] = await asyncio.gather(
+            *(self.get_plan(plan, auth, cache.validators(plan)) for plan in ordered)
+        )
+        return dict(zip(ordered, results))
@@ -0,0 +1,81 @@
+import hashlib
+import re
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import Optional
+
+VERTRETUNGSPLAN_REGEX: re.Pattern = re.compile(r'vertretungsplan-([a-z-]+)\.pdf')
+INFO_CLASS: str = 'FileListCellInfo'
+
+
+class ListingParser(HTMLParser):
+    """
+    Collects the listing timestamp of every substitution plan while the listing is fed in, without building a tree.
+    A plan's timestamp is the text of the FileListCellInfo cell in the same table row as its link.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.plans: dict[str, int] = {}
+        self.__href: Optional[str] = None
+        self.__info: list[str] = []
+        # tag of the info cell while inside of it
+        self.__info_tag: Optional[str] = None
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, Optional[str]]]) -> None:
+        if tag == 'tr':
+            self.__end_row()
+        elif tag == 'a':
+            href: Optional[str] = dict(attrs).get('href')
+            if href and VERTRETUNGSPLAN_REGEX.search(href):
+                self.__href = href
+        elif self.__info_tag is None:
+            classes: Optional[str] = dict(attrs).get('class')
+            if classes and INFO_CLASS in classes.split():
+                self.__info_tag = tag
+                self.__info = []
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == self.__info_tag:
+            self.__info_tag = None
+        elif tag == 'tr':
+            self.__end_row()
+
+    def handle_data(self, data: str) -> None:
+        if self.__info_tag is not None:
+            self.__info.append(data)
+
+    def __end_row(self) -> None:
+        if self.__href and self.__info:
+            modified: datetime = datetime.strptime(''.join(self.__info).strip(), '%d.%m.%Y, %H:%M:%S')
+            self.plans[self.__href] = round(modified.timestamp())
+        self.__href = None
+        self.__info = []
+        self.__info_tag = None
+
+    def close(self) -> None:
+        super().close()
+        self.__end_row()
+
+
+def parse_listing(listing: str) -> dict[str, int]:
+    """The listing timestamp of every substitution plan in the directory listing"""
+    parser: ListingParser = ListingParser()
+    parser.feed(listing)
+    parser.close()
+    return parser.plans
+
+
+class ListingCache:
+    """Remembers the last listing by its hash, so an unchanged listing isn't parsed again"""
+
+    def __init__(self) -> None:
+        self.digest: Optional[bytes] = None
+        self.plans: dict[str, int] = {}
+
+    def parse(self, listing: bytes) -> dict[str, int]:
+        digest: bytes = hashlib.blake2b(listing, digest_size=16).digest()
+        if digest != self.digest:
+            self.plans = parse_listing(listing.decode('utf-8', errors='replace'))
+            self.digest = digest
+        return self.plans
@@ -0,0 +1,33 @@
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+Rows = list[tuple[float, dict[float, str]]]
+
+
+class PageCache:
+    """
+    The text rows extracted from each page, keyed by BackendPage.digest and kept as
+    <digest>.json, so unchanged pages of an updated plan don't have to be extracted again.
+    used lists the digests of all pages looked up, in page order.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory: Path = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.used: list[str] = []
+
+    def get(self, digest: str) -> Optional[Rows]:
+        self.used.append(digest)
+        file: Path = self.directory / f'{digest}.json'
+        if not file.exists():
+            return None
+        return [(y, {x: text for x, text in row}) for y, row in json.loads(file.read_text())]
+
+    def put(self, digest: str, rows: Rows) -> None:
+        file: Path = self.directory / f'{digest}.json'
+        # parse workers can extract the same page at once, so each writes its own file before the rename
+        tmp: Path = self.directory / f'{digest}.{os.getpid()}.tmp'
+        tmp.write_text(json.dumps([(y, list(row.items())) for y, row in rows]))
+        tmp.replace(file)
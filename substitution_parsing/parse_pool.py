@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from logging import warning
+from os import getenv
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from .PDFHandling import PDF, RejectedRow
+from .Substitution import Substitution
+from .page_cache import PageCache
+
+
+class ParseResult:
+    def __init__(
+        self, substitutions: list[Substitution], duration: float, pages: list[str], rejected: list[RejectedRow]
+    ) -> None:
+        self.substitutions: list[Substitution] = substitutions
+        self.duration: float = duration
+        # digests of the plan's pages in the page cache
+        self.pages: list[str] = pages
+        self.rejected: list[RejectedRow] = rejected
+
+
+def parse_plan(file: Path, area: str, page_dir: Optional[Path]) -> ParseResult:
+    """Runs inside a worker process, so only picklable data goes in and out."""
+    start: float = time.perf_counter()
+    page_cache: Optional[PageCache] = PageCache(page_dir) if page_dir else None
+    with PDF.from_file(file, area, page_cache) as pdf:
+        # only the rows leave the worker, the pages are dropped while iterating
+        substitutions: list[Substitution] = list(pdf.to_substitutions())
+        pages: list[str] = page_cache.used if page_cache else []
+        return ParseResult(substitutions, time.perf_counter() - start, pages, pdf.rejected)
+
+
+class ParsePool:
+    """
+    Parses substitution plans on a process pool, so the pdf parsing never runs on the event loop.
+    The worker count and the per-plan timeout are read from PARSE_WORKERS and PARSE_TIMEOUT by default.
+    """
+
+    def __init__(
+        self, workers: Optional[int] = None, timeout: Optional[float] = None, page_dir: Optional[Path] = None
+    ):
+        self.workers: Optional[int] = workers or int(getenv('PARSE_WORKERS') or 0) or None
+        self.timeout: float = timeout or float(getenv('PARSE_TIMEOUT') or 120)
+        self.page_dir: Optional[Path] = page_dir
+        self.__executor: Optional[ProcessPoolExecutor] = None
+
+    def __new_executor(self) -> ProcessPoolExecutor:
+        # forked workers would inherit the event loop, the DB connections and the locks of the running process
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('forkserver'))
+
+    def __enter__(self) -> ParsePool:
+        self.__executor = self.__new_executor()
+        return self
+
+    def __exit__(self, *_) -> None:
+        if self.__executor:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+            self.__executor = None
+
+    def __restart(self, broken: ProcessPoolExecutor) -> None:
+        # a hanging worker can't be cancelled, so the whole pool is torn down and replaced
+        if broken is not self.__executor:
+            # already replaced because of another plan
+            return
+        for process in list((getattr(broken, '_processes', None) or {}).values()):
+            process.terminate()
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.__executor = self.__new_executor()
+
+    async def parse(self, plan: str, file: Path, area: str) -> Optional[ParseResult]:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        executor: ProcessPoolExecutor = self.__executor
+        try:
+            result: ParseResult = await asyncio.wait_for(
+                loop.run_in_executor(executor, parse_plan, file, area, self.page_dir), self.timeout
+            )
+            return result
+        except asyncio.TimeoutError:
+            warning(f'parsing {plan} timed out after {self.timeout}s')
+            self.__restart(executor)
+        except BrokenProcessPool:
+            warning(f'worker crashed while parsing {plan}')
+            self.__restart(executor)
+        except Exception as e:
+            warning(f'failed to parse {plan}: {e!r}')
+        return None
+
+    async def parse_all(
+        self, plans: dict[str, tuple[Path, str]]
+    ) -> AsyncIterator[tuple[str, Optional[ParseResult]]]:
+        """Parses all plans in parallel and yields each result as soon as it is ready."""
+
+        async def run(plan: str, file: Path, area: str) -> tuple[str, Optional[ParseResult]]:
+            return plan, await self.parse(plan, file, area)
+
+        tasks = [run(plan, file, area) for plan, (file, area) in plans.items()]
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
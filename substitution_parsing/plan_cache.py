@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Optional
+
+
+class CacheEntry:
+    def __init__(
+        self, digest: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+        pages: Optional[list[str]] = None
+    ) -> None:
+        self.digest: str = digest
+        self.etag: Optional[str] = etag
+        self.last_modified: Optional[str] = last_modified
+        # digests of the plan's pages in the page cache
+        self.pages: list[str] = pages or []
+
+    def to_dict(self) -> dict:
+        return {'digest': self.digest, 'etag': self.etag, 'last_modified': self.last_modified, 'pages': self.pages}
+
+    @staticmethod
+    def from_dict(data: dict) -> CacheEntry:
+        return CacheEntry(data['digest'], data.get('etag'), data.get('last_modified'), data.get('pages'))
+
+
+class PlanCache:
+    """
+    On-disk cache of substitution plans, keyed by the sha256 of their content.
+    Per plan url the digest of the last ingested version and its http validators are kept in index.json.
+    The rows extracted from each page are kept in the pages directory, see PageCache.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory: Path = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.__index_file: Path = directory / 'index.json'
+        self.__index: dict[str, CacheEntry] = {}
+        if self.__index_file.exists():
+            with self.__index_file.open() as f:
+                self.__index = {plan: CacheEntry.from_dict(entry) for plan, entry in json.load(f).items()}
+
+    def get(self, plan: str) -> Optional[CacheEntry]:
+        entry: Optional[CacheEntry] = self.__index.get(plan)
+        if entry and not self.path(entry.digest).exists():
+            return None
+        return entry
+
+    def validators(self, plan: str) -> dict[str, str]:
+        """Headers for a conditional GET of the plan, empty if it isn't cached."""
+        headers: dict[str, str] = {}
+        if entry := self.get(plan):
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    @property
+    def page_dir(self) -> Path:
+        return self.directory / 'pages'
+
+    def path(self, digest: str) -> Path:
+        return self.directory / f'{digest}.pdf'
+
+    def store(self, content: bytes) -> str:
+        digest: str = hashlib.sha256(content).hexdigest()
+        target: Path = self.path(digest)
+        if not target.exists():
+            tmp: Path = target.with_suffix('.tmp')
+            tmp.write_bytes(content)
+            tmp.replace(target)
+        return digest
+
+    def commit(self, plan: str, entry: CacheEntry) -> None:
+        """Records entry as the ingested version of plan and drops files no plan refers to anymore."""
+        previous: Optional[CacheEntry] = self.__index.get(plan)
+        if previous and previous.digest == entry.digest and not entry.pages:
+            entry.pages = previous.pages
+        self.__index[plan] = entry
+        with self.__index_file.open('w') as f:
+            json.dump({plan: e.to_dict() for plan, e in self.__index.items()}, f)
+        if not previous:
+            return
+        if previous.digest != entry.digest and all(e.digest != previous.digest for e in self.__index.values()):
+            self.path(previous.digest).unlink(missing_ok=True)
+        referenced: set[str] = {page for e in self.__index.values() for page in e.pages}
+        for page in set(previous.pages) - referenced:
+            (self.page_dir / f'{page}.json').unlink(missing_ok=True)
@@ -0,0 +1,108 @@
+import random
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+HOUR: int = 60 * 60
+WEEK: int = 7 * 24 * HOUR
+WEEKDAYS: list[str] = ['Mo', 'Di', 'Mi', 'Do', 'Fr', 'Sa', 'So']
+
+# (weekday, hour) in local time
+Slot = tuple[int, int]
+
+
+def slot_of(timestamp: float) -> Slot:
+    moment: datetime = datetime.fromtimestamp(timestamp)
+    return moment.weekday(), moment.hour
+
+
+class PollScheduler:
+    """
+    Derives the listing poll interval from the history of plan modification times, per hour of the week.
+    Hours in which plans usually change busy_rate times or more are polled every min_interval,
+    hours without changes every max_interval.
+    Until min_history modifications are known, every hour uses default_interval.
+    Failed polls back off exponentially up to max_backoff, all delays get a random jitter.
+    """
+
+    def __init__(
+        self, modifications: Iterable[int] = (), min_interval: float = 120.0, max_interval: float = 30 * 60.0,
+        default_interval: float = 5 * 60.0, history: int = 4 * WEEK, min_history: int = 20, busy_rate: float = 2.0,
+        jitter: float = 0.1, max_backoff: float = HOUR
+    ) -> None:
+        self.min_interval: float = min_interval
+        self.max_interval: float = max_interval
+        self.default_interval: float = default_interval
+        self.history: int = history
+        self.min_history: int = min_history
+        self.busy_rate: float = busy_rate
+        self.jitter: float = jitter
+        self.max_backoff: float = max_backoff
+        self.errors: int = 0
+        self.modifications: set[int] = set(modifications)
+        self.__intervals: Optional[dict[Slot, float]] = None
+        self.__computed: float = 0.0
+
+    def record(self, modifications: Iterable[int]) -> None:
+        """Adds newly observed plan modification times"""
+        new: set[int] = set(modifications) - self.modifications
+        if new:
+            self.modifications |= new
+            self.__intervals = None
+
+    def succeeded(self) -> None:
+        self.errors = 0
+
+    def failed(self) -> None:
+        self.errors += 1
+
+    def intervals(self, now: float) -> dict[Slot, float]:
+        """The poll interval of every hour of the week, recomputed daily and after new modifications were recorded"""
+        if self.__intervals is not None and now - self.__computed < 24 * HOUR:
+            return self.__intervals
+        self.__computed = now
+        recent: list[int] = [m for m in self.modifications if m > now - self.history]
+        self.modifications = set(recent)
+        if len(recent) < self.min_history:
+            self.__intervals = {(day, hour): self.default_interval for day in range(7) for hour in range(24)}
+            return self.__intervals
+        weeks: float = max(1.0, min(self.history, now - min(recent)) / WEEK)
+        counts: dict[Slot, int] = {}
+        for modification in recent:
+            slot: Slot = slot_of(modification)
+            counts[slot] = counts.get(slot, 0) + 1
+        # polls per hour grow with the square root of the change rate, which minimizes the sum of
+        # polls and detection delay for randomly timed changes
+        scale: float = ((self.max_interval / self.min_interval) ** 2 - 1) / self.busy_rate
+        self.__intervals = {}
+        for day in range(7):
+            for hour in range(24):
+                index: int = day * 24 + hour
+                neighbours: list[Slot] = [divmod((index + i) % (7 * 24), 24) for i in (-1, 1)]
+                # changes per hour, the neighbouring hours count half so a slightly early change isn't missed
+                rate: float = max([counts.get((day, hour), 0)] + [counts.get(n, 0) / 2 for n in neighbours]) / weeks
+                self.__intervals[(day, hour)] = max(self.min_interval, self.max_interval / (1 + rate * scale) ** 0.5)
+        return self.__intervals
+
+    def next_delay(self, now: float) -> float:
+        """Seconds until the next poll"""
+        intervals: dict[Slot, float] = self.intervals(now)
+        delay: float = intervals[slot_of(now)]
+        # don't sleep through the start of the next, possibly busier, hour
+        next_hour: datetime = datetime.fromtimestamp(now).replace(minute=0, second=0, microsecond=0) \
+            + timedelta(hours=1)
+        until_next_hour: float = next_hour.timestamp() - now
+        delay = min(delay, until_next_hour + intervals[slot_of(next_hour.timestamp())])
+        if self.errors:
+            delay = min(max(self.max_backoff, delay), delay * 2 ** self.errors)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def describe(self, now: float) -> str:
+        """The poll interval in minutes for every hour of the week, as a table for the log"""
+        intervals: dict[Slot, float] = self.intervals(now)
+        lines: list[str] = [
+            f'poll schedule from {len(self.modifications)} plan modifications, minutes between polls:',
+            '    ' + ' '.join(f'{hour:>2}' for hour in range(24)),
+        ]
+        for day in range(7):
+            lines.append(f'{WEEKDAYS[day]}  ' + ' '.join(f'{intervals[(day, hour)] / 60:>2.0f}' for hour in range(24)))
+        return '\n'.join(lines)
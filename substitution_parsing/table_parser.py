@@ -1,23 +1,40 @@
 import re
-from statistics import median_high
-from typing import Optional
+from bisect import bisect_left
+from typing import Iterator, Optional
 
-from PyPDF2 import PdfReader
-
-Elements = dict[float, dict[float, str]]
+from .extraction import BackendPage, Elements, ExtractionBackend
+from .page_cache import PageCache, Rows
 
 DATE_REGEX: re.Pattern = re.compile(r'[a-zA-Z] [0-9]{2}\.[0-9]{2}\.[0-9]{2,4}')
+# fragments whose y differs by less than this belong to the same row
+ROW_TOLERANCE: float = 2.0
 
 
 class Table:
+    """Stores its cells column by column, so normalization can work on whole columns"""
+
     def __init__(self):
-        self.rows: list[list[Optional[str]]] = []
+        self.columns: list[list[Optional[str]]] = []
         self.head: list[str] = []
         self.__column_positions: list[float] = []
         self.title: Optional[str] = None
 
+    @property
+    def row_count(self) -> int:
+        return len(self.columns[0]) if self.columns else 0
+
+    @property
+    def rows(self) -> list[list[Optional[str]]]:
+        return [list(row) for row in zip(*self.columns)]
+
     def __get_row_index(self, position: float) -> int:
-        return min(((abs(position - v), i) for i, v in enumerate(self.__column_positions)), key=lambda x: x[0])[1]
+        # index of the closest column position, the positions are sorted
+        idx: int = bisect_left(self.__column_positions, position)
+        if idx == len(self.__column_positions):
+            return idx - 1
+        if idx > 0 and position - self.__column_positions[idx - 1] <= self.__column_positions[idx] - position:
+            return idx - 1
+        return idx
 
     def __format_row(self, row: dict[float, str]) -> list[Optional[str]]:
         result: list[Optional[str]] = [None for _ in range(len(self.__column_positions))]
@@ -27,16 +44,16 @@ class Table:
         return result
 
     def add_row(self, row: dict[float, str]):
-        if not self.head:
-            self.__column_positions = list(sorted(row.keys()))
-        formatted_row: list[Optional[str]] = self.__format_row(row)
         if self.head:
-            self.rows.append(formatted_row)
-        else:
-            self.head = formatted_row
+            for column, cell in zip(self.columns, self.__format_row(row)):
+                column.append(cell)
+            return
+        self.__column_positions = list(sorted(row.keys()))
+        self.head = self.__format_row(row)
+        self.columns = [[] for _ in self.__column_positions]
 
     def __bool__(self) -> bool:
-        return bool(self.head or self.rows)
+        return bool(self.head or self.row_count)
 
     def __str__(self) -> str:
         result: str = str(self.title) + '\n'
@@ -47,57 +64,69 @@ class Table:
         return result
 
 
-def create_visitor(elements: Elements, page_offset: int):
-    def visitor(text: str, cm, tm, *_):
-        text = text.strip()
-        if not text:
-            return
-        x: float = cm[4]
-        y: float = -cm[5] + page_offset
-        if tm[5] < 1000:
-            x += tm[4]
-            y += tm[5]
-        if not elements.get(y):
-            elements[y] = {}
-        elements[y][x] = text
-
-    return visitor
-
-
-def parse_tables(file: PdfReader) -> list[Table]:
-    elements: Elements = {}
-    page_offset: int = 0
-
-    for page in file.pages:
-        page.extract_text(visitor_text=create_visitor(elements, page_offset))
-        page_offset += float(page.mediabox.height)
-
-    lines: list[float] = list(sorted(k for k, v in elements.items() if len(v) > 2))
-    distances: list[float] = [f - c for c, f in zip(lines, lines[1:])]
-    median_dist: float = median_high(distances)
-
-    results: list[Table] = []
+def group_rows(elements: Elements) -> Rows:
+    """Sorts the fragments once and clusters them into rows, so sub-point jitter in y doesn't split a row"""
+    rows: Rows = []
+    for y, x, text in sorted(elements):
+        if rows and y - rows[-1][0] < ROW_TOLERANCE:
+            rows[-1][1][x] = text
+        else:
+            rows.append((y, {x: text}))
+    return rows
+
+
+def extract_rows(page: BackendPage, page_offset: float, page_cache: Optional[PageCache] = None) -> Rows:
+    """The rows of a single page, taken from page_cache if the page's content didn't change"""
+    rows: Optional[Rows] = None
+    digest: Optional[str] = None
+    if page_cache:
+        digest = page.digest()
+        rows = page_cache.get(digest)
+    if rows is None:
+        rows = group_rows(page.fragments())
+        if page_cache:
+            page_cache.put(digest, rows)
+    return [(y + page_offset, row) for y, row in rows]
+
+
+def iter_tables(backend: ExtractionBackend, page_cache: Optional[PageCache] = None) -> Iterator[Table]:
+    """
+    Extracts one page at a time and yields each table as soon as no later row can be added to it anymore.
+    """
+    # the last finished table, rows without a title of their own continue it
+    previous: Optional[Table] = None
     last_y: float = 0.0
     current_table: Table = Table()
-
-    for y in sorted(elements.keys()):
-        row: dict[float, str] = elements[y]
-        is_distant: bool = y - last_y > 30
-        if is_distant and current_table:
-            results.append(current_table)
-            current_table = Table()
-        if len(row) <= 2:
-            joined: str = ' '.join(row.values())
-            if DATE_REGEX.search(joined):
-                current_table.title = joined
-        else:
-            if current_table.title:
-                current_table.add_row(row)
+    page_offset: float = 0
+
+    for page in backend.pages():
+        rows: Rows = extract_rows(page, page_offset, page_cache)
+        page_offset += page.height
+
+        for y, row in rows:
+            is_distant: bool = y - last_y > 30
+            if is_distant and current_table:
+                if previous:
+                    yield previous
+                previous = current_table
+                current_table = Table()
+            if len(row) <= 2:
+                joined: str = ' '.join(row[x] for x in sorted(row))
+                if DATE_REGEX.search(joined):
+                    current_table.title = joined
             else:
-                results[-1].add_row(row)
-            last_y = y
-
+                if current_table.title:
+                    current_table.add_row(row)
+                elif previous:
+                    previous.add_row(row)
+                # rows before the first table title don't belong to any table
+                last_y = y
+
+    if previous:
+        yield previous
     if current_table:
-        results.append(current_table)
+        yield current_table
+
 
-    return results
+def parse_tables(backend: ExtractionBackend) -> list[Table]:
+    return list(iter_tables(backend))
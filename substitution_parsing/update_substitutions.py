@@ -1,62 +1,170 @@
-import re
-from datetime import datetime
+import time
 from asyncio import sleep
 from sqlite3 import IntegrityError
-from logging import info
-
-import requests
-from bs4 import BeautifulSoup
+from collections import Counter
+from logging import info, warning
+from os import getenv
+from pathlib import Path
+from typing import Optional
 
 from util.DB import DB
-from .PDFHandling import PDF
-
-VERTRETUNGSPLAN_REGEX: re.Pattern = re.compile(r'vertretungsplan-([a-z-]+)\.pdf')
-
-
-def is_updated(last_updated: dict[str, datetime]) -> set[str]:
-    auth: tuple[str, str] = DB.get_latest_credential()
-    resp: requests.Response = requests.get('https://geschuetzt.bszet.de/index.php?dir=/Vertretungsplaene', auth=auth)
-    if resp.status_code != 200:
-        print(f'Error fetching status, {resp.text}')
-        return set()
-    soup: BeautifulSoup = BeautifulSoup(resp.text, 'html.parser')
-    to_update: set[str] = set()
-    for a in soup.find_all(href=VERTRETUNGSPLAN_REGEX):
-        tr = a.find_parent('tr')
-        href: str = a['href']
-        last_updated_txt: str = tr.find(class_='FileListCellInfo').text.strip()
-        last_modified = datetime.strptime(last_updated_txt, '%d.%m.%Y, %H:%M:%S')
-        if last_modified > last_updated.get(href, datetime.min) and not href.endswith('fs.pdf'):
-            to_update.add(href)
+from util.event_bus import event_bus
+from util.message_cache import message_cache
+from util.metrics import Counter as CounterMetric, Histogram, metrics
+from .ChangeSet import ChangeSet
+from .CrawlState import CrawlState
+from .Substitution import Substitution
+from .fetcher import BASE_URL, Fetcher, FetchResult
+from .listing_parser import ListingCache, VERTRETUNGSPLAN_REGEX
+from .parse_pool import ParsePool
+from .plan_cache import CacheEntry, PlanCache
+from .poll_scheduler import PollScheduler, WEEK
+
+# the listing rarely changes between two polls
+listing_cache: ListingCache = ListingCache()
+
+PARSE_TIME: Histogram = metrics.histogram('bszet_plan_parse_seconds', 'Time to parse a substitution plan', ('area',))
+PARSE_FAILURES: CounterMetric = metrics.counter(
+    'bszet_plan_parse_failures_total', 'Substitution plans that failed to parse or timed out', ('area',)
+)
+ROWS: CounterMetric = metrics.counter(
+    'bszet_substitution_rows_total', 'Substitution rows written to the database', ('area', 'change')
+)
+
+
+async def is_updated(fetcher: Fetcher, states: dict[str, CrawlState]) -> Optional[dict[str, int]]:
+    """Returns the listing timestamp of every plan that changed since it was last ingested, None if the fetch failed"""
+    auth: Optional[tuple[str, str]] = await DB.read(DB.get_latest_credential)
+    if auth is None:
+        # not a failed fetch, polling goes on at the usual interval until someone verifies
+        warning("no credentials stored yet, verify with the bot to start fetching substitution plans")
+        return {}
+    listing: Optional[bytes] = await fetcher.get_listing(auth)
+    if listing is None:
+        return None
+    to_update: dict[str, int] = {}
+    for href, last_modified in listing_cache.parse(listing).items():
+        state: Optional[CrawlState] = states.get(href)
+        if (not state or last_modified > state.listing_modified) and not href.endswith('fs.pdf'):
+            to_update[href] = last_modified
     return to_update
 
 
-def do_update(last_updated: dict[str, datetime], to_update: set[str]) -> None:
-    auth: tuple[str, str] = DB.get_latest_credential()
-    for plan in to_update:
+async def save_state(states: dict[str, CrawlState], state: CrawlState) -> None:
+    states[state.plan] = state
+    await DB.write(DB.set_crawl_state, state)
+
+
+async def do_update(
+    fetcher: Fetcher, pool: ParsePool, cache: PlanCache, states: dict[str, CrawlState], to_update: dict[str, int]
+) -> None:
+    auth: Optional[tuple[str, str]] = await DB.read(DB.get_latest_credential)
+    if auth is None:
+        return
+    results: dict[str, Optional[FetchResult]] = await fetcher.get_plans(set(to_update), auth, cache)
+    to_parse: dict[str, tuple[Path, str]] = {}
+    entries: dict[str, CacheEntry] = {}
+    for plan, result in results.items():
+        if result is None:
+            continue
+        previous: CrawlState = states.get(plan) or CrawlState(plan)
+        if result.not_modified and cache.get(plan):
+            info(f"substitution plan {plan} not modified")
+            previous.listing_modified = to_update[plan]
+            await save_state(states, previous)
+            continue
+        entry: CacheEntry = CacheEntry(cache.store(result.content), result.etag, result.last_modified)
+        if previous.digest == entry.digest:
+            info(f"substitution plan {plan} has identical content")
+            cache.commit(plan, entry)
+            previous.listing_modified = to_update[plan]
+            await save_state(states, previous)
+            continue
+        entries[plan] = entry
+        to_parse[plan] = (cache.path(entry.digest), VERTRETUNGSPLAN_REGEX.search(plan).group(1))
+    async for plan, parsed in pool.parse_all(to_parse):
+        area: str = to_parse[plan][1]
+        if parsed is None:
+            PARSE_FAILURES.inc(area=area)
+            continue
+        PARSE_TIME.observe(parsed.duration, area=area)
+        substitutions: list[Substitution] = parsed.substitutions
         info(f"updating substitution plan {plan}")
-        resp: requests.Response = requests.get(f'https://geschuetzt.bszet.de/{plan}', auth=auth)
-        if resp.status_code != 200:
-            print(f'Error fetching document, {resp.text}')
-            return
-        pdf: PDF = PDF.from_bytes(resp.content, VERTRETUNGSPLAN_REGEX.search(plan).group(1))
-        for substitution in pdf.to_substitutions():
-            try:
-                DB.insert_or_modify_substitution(substitution)
-            except IntegrityError:
-                # don't crash due to integrity error
-                print(substitution)
-        last_updated[plan] = datetime.now()
-
-
-def update(last_updated: dict[str, datetime]):
+        if parsed.rejected:
+            reasons: Counter[str] = Counter(row.reason for row in parsed.rejected)
+            warning(f"{plan}: rejected {len(parsed.rejected)} rows, {dict(reasons)}")
+        try:
+            changes: ChangeSet = await DB.write(DB.apply_plan, area, substitutions)
+        except IntegrityError as e:
+            # don't crash due to integrity error
+            warning(f'Error writing {plan}, {e!r}')
+            continue
+        info(f"{plan}: {changes!r}")
+        ROWS.inc(len(changes.inserted), area=area, change='inserted')
+        ROWS.inc(len(changes.updated), area=area, change='updated')
+        ROWS.inc(len(changes.removed), area=area, change='removed')
+        message_cache.invalidate(changes.changed_classes)
+        event_bus.publish(changes.changed_classes)
+        entries[plan].pages = parsed.pages
+        cache.commit(plan, entries[plan])
+        await save_state(
+            states, CrawlState(plan, to_update[plan], entries[plan].digest, parsed.duration, len(substitutions))
+        )
+
+
+async def update(
+    fetcher: Fetcher, pool: ParsePool, cache: PlanCache, states: dict[str, CrawlState]
+) -> Optional[dict[str, int]]:
+    """Returns the listing timestamps of the changed plans, None if the listing couldn't be fetched"""
     info("Checking for new substitution plans")
-    if to_update := is_updated(last_updated):
-        do_update(last_updated, to_update)
+    to_update: Optional[dict[str, int]] = await is_updated(fetcher, states)
+    if to_update:
+        await DB.write(DB.add_plan_modifications, to_update)
+        await do_update(fetcher, pool, cache, states, to_update)
+    return to_update
+
+
+async def compact_change_log(retention: int) -> None:
+    removed: int = await DB.write(DB.compact_change_log, retention)
+    info(f"removed {removed} entries from the change log")
+
+
+async def prune_plan_modifications(history: int) -> None:
+    removed: int = await DB.write(DB.prune_plan_modifications, round(time.time()) - history)
+    info(f"removed {removed} plan modifications older than the scheduler's history")
 
 
 async def continuous_update():
-    last_updated: dict[str, datetime] = {}
-    while True:
-        update(last_updated)
-        await sleep(5 * 60)
+    # loaded from the DB, so a restart only costs a single listing fetch
+    states: dict[str, CrawlState] = await DB.read(DB.get_crawl_states)
+    retention: int = int(getenv('CHANGE_LOG_RETENTION', str(7 * 24 * 60 * 60)))
+    last_compaction: float = 0.0
+    history: int = 4 * WEEK
+    scheduler: PollScheduler = PollScheduler(
+        await DB.read(DB.get_plan_modifications, round(time.time()) - history),
+        history=history,
+        min_interval=float(getenv('POLL_MIN_INTERVAL', '120')),
+        max_interval=float(getenv('POLL_MAX_INTERVAL', '1800')),
+    )
+    last_schedule: str = ''
+    cache_dir: Path = Path(getenv('PLAN_CACHE_DIR', 'plan_cache'))
+    cache: PlanCache = PlanCache(cache_dir)
+    with ParsePool(page_dir=cache.page_dir) as pool:
+        async with Fetcher(base_url=getenv('PLAN_BASE_URL') or BASE_URL) as fetcher:
+            while True:
+                changed: Optional[dict[str, int]] = await update(fetcher, pool, cache, states)
+                if changed is None:
+                    scheduler.failed()
+                else:
+                    scheduler.succeeded()
+                    scheduler.record(changed.values())
+                if time.time() - last_compaction > 60 * 60:
+                    await compact_change_log(retention)
+                    await prune_plan_modifications(history)
+                    last_compaction = time.time()
+                if (schedule := scheduler.describe(time.time())) != last_schedule:
+                    info(schedule)
+                    last_schedule = schedule
+                delay: float = scheduler.next_delay(time.time())
+                info(f"next check for new substitution plans in {delay:.0f}s")
+                await sleep(delay)
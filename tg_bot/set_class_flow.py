@@ -6,7 +6,7 @@ from telegram.ext import ConversationHandler, ContextTypes, CommandHandler, Mess
 
 from util.DB import DB
 
-from .update_users import update_user
+from .update_users import notifier
 
 SELECT_AREA, SELECT_CLASS, SAVE_CLASS = range(3)
 CLASS_REGEX: re.Pattern = re.compile(r'^(?:[A-Z]_[A-Z]+ ?[0-9]+/[0-9]+|[A-Z]+ ?[0-9]+)$')
@@ -17,10 +17,10 @@ def group_entries(plain: list[str]) -> list[list[str]]:
 
 
 async def set_class(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    if not DB.is_trusted_user(update.effective_user.id):
+    if not await DB.read(DB.is_trusted_user, update.effective_user.id):
         await update.message.reply_text('Du musst dich zuerst verifizieren! Das ist möglich mit /verify')
         return ConversationHandler.END
-    areas: list[list[str]] = group_entries(DB.get_areas())
+    areas: list[list[str]] = group_entries(await DB.read(DB.get_areas))
     markup: ReplyKeyboardMarkup = ReplyKeyboardMarkup(
         areas, one_time_keyboard=True, resize_keyboard=True, input_field_placeholder='Bereich'
     )
@@ -30,7 +30,7 @@ async def set_class(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 async def area_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     area: str = update.message.text
-    classes: list[list[str]] = group_entries(DB.get_all_recent_classes_for_area(area))
+    classes: list[list[str]] = group_entries(await DB.read(DB.get_all_recent_classes_for_area, area))
     if not classes:
         await update.message.reply_text(
             'Leider wurden für den Bereich keine Klassen gefunden', reply_markup=ReplyKeyboardRemove()
@@ -54,7 +54,7 @@ async def class_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     class_name: str = update.message.text
     area: str = context.user_data['area']
     del context.user_data['area']
-    if not DB.check_if_class_exists(area, class_name):
+    if not await DB.read(DB.check_if_class_exists, area, class_name):
         if CLASS_REGEX.match(class_name) and len(class_name) < 20:
             context.user_data['class'] = class_name
             context.user_data['area'] = area
@@ -65,12 +65,12 @@ async def class_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             return SAVE_CLASS
         await update.message.reply_text('Leider wurde die Klasse nicht gefunden', reply_markup=ReplyKeyboardRemove())
         return ConversationHandler.END
-    DB.add_user_to_class(update.effective_user.id, class_name)
-    DB.update_user(update.effective_user.id, is_zero=True)
+    await DB.write(DB.add_user_to_class, update.effective_user.id, class_name)
+    await DB.write(DB.update_user, update.effective_user.id, is_zero=True)
     await update.message.reply_text(
         f'Du hast erfolgreich die Klasse {class_name} ausgewählt.', reply_markup=ReplyKeyboardRemove()
     )
-    await update_user(update.effective_user.id, context.bot)
+    await notifier.update_user(update.effective_user.id, context.bot)
     return ConversationHandler.END
 
 
@@ -79,7 +79,7 @@ async def save_class(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     area: str = context.user_data['area']
     context.user_data.clear()
     if update.message.text == 'Ja':
-        DB.add_class_if_not_exists(class_name, area)
+        await DB.write(DB.add_class_if_not_exists, class_name, area)
         await update.message.reply_text(
             f'Erfolgreich zu Klasse {class_name} hinzugefügt.', reply_markup=ReplyKeyboardRemove()
         )
@@ -18,7 +18,7 @@ async def stop_bot(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 async def actually_stop_bot(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     message_content: str = 'Vielen dank, dass du dich entshieden hast, zu bleiben.'
     if update.message.text == 'Ja':
-        DB.delete_user(update.effective_user.id)
+        await DB.write(DB.delete_user, update.effective_user.id)
         message_content = ('Auf wiedersehen. Bedenke, dass du zuerst /start aufrufen musst, '
                            'bevor du weitere Befehle verwenden kannst')
     await update.message.reply_text(message_content, reply_markup=ReplyKeyboardRemove())
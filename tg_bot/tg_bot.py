@@ -17,12 +17,12 @@ from util.DB import DB
 
 
 async def removeclass(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    DB.clear_user_class(update.effective_user.id)
+    await DB.write(DB.clear_user_class, update.effective_user.id)
     await update.message.reply_text(f'Letzte Klasse erfolgreich entfernt.')
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    DB.add_user(update.effective_user.id)
+    await DB.write(DB.add_user, update.effective_user.id)
     await update.message.reply_text('Um diesen Bot zu verwenden, verifiziere dich mit /verify.')
 
 
@@ -67,7 +67,8 @@ async def main() -> None:
     app.add_handler(CommandHandler('clear_class', removeclass))
     app.add_handler(MessageHandler(filters.COMMAND, unknown))
     app.add_error_handler(error_handler)
-    app.job_queue.run_repeating(tg_bot.update_users.message_users, 60)
+    # changes are pushed by the event bus, polling only catches what it missed
+    app.job_queue.run_repeating(tg_bot.update_users.message_users, float(getenv('NOTIFY_POLL_INTERVAL', '900')))
 
     def error_callback(exc: TelegramError) -> None:
             app.create_task(app.process_error(error=exc, update=None))
@@ -76,6 +77,7 @@ async def main() -> None:
         try:
             await app.updater.start_polling(error_callback=error_callback)
             await app.start()
+            app.create_task(tg_bot.update_users.notifier.listen(app.bot))
             while True:
                 await asyncio.sleep(100)
         except:
@@ -1,36 +1,47 @@
 from datetime import datetime
+from typing import Optional
 
 from telegram import Bot
 from telegram.constants import ParseMode
-from telegram.error import Forbidden
+from telegram.error import Forbidden, RetryAfter
 from telegram.ext import CallbackContext
 from telegram.helpers import escape_markdown
 
-from util.DB import DB
-
-
-async def update_user(uid: int, bot: Bot) -> None:
-    result: str = 'Aktuelle Vertretungen:\n\n'
-    is_new: bool = False
-    for substitution in DB.get_all_substitutions_for_user(uid):
-        line: str = datetime.fromtimestamp(substitution.day).strftime('%a, %d.%m')
-        line += f', {substitution.lesson}: {substitution.teacher} {substitution.subject} {substitution.room}'
-        if substitution.notes:
-            line += f' ({substitution.notes})'
-        line = escape_markdown(line, version=2)
-        if substitution.is_new:
-            line = f'*{line}*'
-            is_new = True
-        result += line + '\n'
-    if is_new:
-        try:
-            await bot.send_message(chat_id=uid, text=result, parse_mode=ParseMode.MARKDOWN_V2)
-            DB.update_user(uid)
-        except Forbidden:
-            DB.delete_user(uid)
+from substitution_parsing.Substitution import Substitution
+from util.dispatcher import Dispatcher
+from util.notifier import Notifier
 
 
-async def message_users(context: CallbackContext) -> None:
-    for uid in DB.get_all_updated_users():
-        await update_user(uid, context.bot)
+def retry_after(e: Exception) -> Optional[float]:
+    return float(e.retry_after) if isinstance(e, RetryAfter) else None
+
+
+def format_line(substitution: Substitution) -> str:
+    line: str = datetime.fromtimestamp(substitution.day).strftime('%a, %d.%m')
+    line += f', {substitution.lesson}: {substitution.teacher} {substitution.subject} {substitution.room}'
+    if substitution.notes:
+        line += f' ({substitution.notes})'
+    return escape_markdown(line, version=2)
+
+
+def bold(line: str) -> str:
+    return f'*{line}*'
+
 
+async def send_update(uid: int, text: str, bot: Bot) -> bool:
+    try:
+        await bot.send_message(chat_id=uid, text=text, parse_mode=ParseMode.MARKDOWN_V2)
+    except Forbidden:
+        return False
+    return True
+
+
+# bot api limits: about 30 messages per second overall and one per second per chat
+dispatcher: Dispatcher = Dispatcher('telegram', 30.0, 1.0, retry_after=retry_after)
+# the bot is passed on to send_update, e.g. notifier.update_user(uid, bot)
+notifier: Notifier = Notifier('tg', dispatcher, send_update, format_line, bold)
+
+
+async def message_users(context: CallbackContext) -> None:
+    """Safety net for changes that weren't published on the event bus, e.g. because of a restart"""
+    await notifier.notify(context.bot)
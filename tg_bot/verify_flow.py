@@ -22,9 +22,9 @@ async def entered_password(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     password: str = update.message.text
     username: str = context.user_data['username']
     del context.user_data['username']
-    is_valid: bool = check_credentials(username, password)
+    is_valid: bool = await check_credentials(username, password)
     if is_valid:
-        DB.trust_user(update.effective_user.id)
+        await DB.write(DB.trust_user, update.effective_user.id)
         await update.message.reply_text(
             'Du wurdest erfolgreich verifiziert. Die Klasse kannst du mit /set_class setzen'
         )
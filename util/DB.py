@@ -1,30 +1,139 @@
+import asyncio
 import sqlite3
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import groupby
+from logging import info
+from operator import itemgetter
+from os import getenv
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Collection, Iterable, Optional, TypeVar
 
+from substitution_parsing.ChangeSet import ChangeSet
+from substitution_parsing.CrawlState import CrawlState
 from substitution_parsing.Substitution import Substitution
+from .metrics import Histogram, metrics
+
+
+SubstitutionKey = tuple[str, int, int]
+MIGRATIONS_DIR: Path = Path(__file__).parent.parent / 'migrations'
+CACHED_STATEMENTS: int = 256
+T = TypeVar('T')
+
+# connection of the current writer or reader thread
+_local: threading.local = threading.local()
+
+STATEMENT_TIME: Histogram = metrics.histogram(
+    'bszet_db_statement_seconds', 'Time a DB method ran, excluding the wait for a free thread', ('pool', 'statement')
+)
 
 
 def password_to_credentials_id(password: str) -> int:
     return int(password.split('#')[-1])
 
 
+class PendingClass:
+    """A class with the users that haven't seen its latest substitutions"""
+
+    def __init__(self, gid: str, users: list[tuple[int, int]], substitutions: list[tuple[Substitution, int]]) -> None:
+        self.gid: str = gid
+        # (uid, last_seq)
+        self.users: list[tuple[int, int]] = users
+        # (substitution, seq)
+        self.substitutions: list[tuple[Substitution, int]] = substitutions
+
+
+def timed(pool: str, statement: Callable[..., T], *args, **kwargs) -> T:
+    name: str = getattr(statement, '__name__', type(statement).__name__)
+    with STATEMENT_TIME.time(pool=pool, statement=name):
+        return statement(*args, **kwargs)
+
+
+def connect(db_location: Path, read_only: bool = False) -> sqlite3.Connection:
+    if read_only:
+        conn: sqlite3.Connection = sqlite3.connect(
+            f'{db_location.resolve().as_uri()}?mode=ro', uri=True, cached_statements=CACHED_STATEMENTS
+        )
+    else:
+        conn = sqlite3.connect(db_location, cached_statements=CACHED_STATEMENTS)
+        conn.execute('pragma journal_mode = wal')
+        conn.execute('pragma synchronous = normal')
+    conn.execute('pragma busy_timeout = 5000')
+    conn.execute('pragma temp_store = memory')
+    conn.execute('pragma cache_size = -16000')
+    conn.execute('pragma mmap_size = 268435456')
+    return conn
+
+
 class DB:
+    """
+    All queries run on a per-thread connection. After init_db, async code should go through read and write:
+    writes are serialized on a single writer thread, reads run on a small pool of read-only connections.
+    """
     conn: sqlite3.Connection = sqlite3.connect(':memory:')
+    writer: Optional[ThreadPoolExecutor] = None
+    readers: Optional[ThreadPoolExecutor] = None
 
     @classmethod
     def init_db(cls, db_location: Path) -> None:
-        cls.conn: sqlite3.Connection = sqlite3.connect(db_location)
+        cls.conn: sqlite3.Connection = connect(db_location)
+        cls.migrate()
+
+        def open_connection(read_only: bool) -> None:
+            _local.conn = connect(db_location, read_only)
+
+        cls.writer = ThreadPoolExecutor(1, 'db-writer', open_connection, (False,))
+        cls.readers = ThreadPoolExecutor(int(getenv('DB_READERS', '4')), 'db-reader', open_connection, (True,))
+
+    @classmethod
+    def connection(cls) -> sqlite3.Connection:
+        return getattr(_local, 'conn', cls.conn)
+
+    @classmethod
+    async def read(cls, query: Callable[..., T], *args, **kwargs) -> T:
+        """Runs query, one of the read-only DB methods, on the reader pool"""
+        if cls.readers is None:
+            return timed('read', query, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            cls.readers, partial(timed, 'read', query, *args, **kwargs)
+        )
 
     @classmethod
-    def get_latest_credential(cls) -> tuple[str, str]:
-        cur: sqlite3.Cursor = cls.conn.execute('select username, password from credentials order by yid desc limit 1')
+    async def write(cls, statement: Callable[..., T], *args, **kwargs) -> T:
+        """Runs statement, one of the DB methods, on the writer thread"""
+        if cls.writer is None:
+            return timed('write', statement, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            cls.writer, partial(timed, 'write', statement, *args, **kwargs)
+        )
+
+    @classmethod
+    def migrate(cls) -> None:
+        """Applies all migrations newer than the user_version of the database, each in its own transaction"""
+        version: int = cls.conn.execute('pragma user_version').fetchone()[0]
+        for migration in sorted(MIGRATIONS_DIR.glob('*.sql')):
+            migration_version: int = int(migration.name.split('_')[0])
+            if migration_version <= version:
+                continue
+            info(f'applying database migration {migration.name}')
+            try:
+                cls.conn.executescript(
+                    f'begin;\n{migration.read_text()}\npragma user_version = {migration_version};\ncommit;'
+                )
+            except sqlite3.Error:
+                cls.conn.rollback()
+                raise
+
+    @classmethod
+    def get_latest_credential(cls) -> Optional[tuple[str, str]]:
+        """None until someone verified with valid credentials"""
+        cur: sqlite3.Cursor = cls.connection().execute('select username, password from credentials order by yid desc limit 1')
         return cur.fetchone()
 
     @classmethod
     def add_new_credential(cls, username: str, password: str) -> None:
-        with cls.conn as transaction:
+        with cls.connection() as transaction:
             yid: int = password_to_credentials_id(password)
             transaction.execute(
                 'insert into credentials values (?, ?, ?) on conflict do nothing', (yid, username, password)
@@ -32,44 +141,44 @@ class DB:
 
     @classmethod
     def add_user(cls, user_id: int, platform: str = 'tg') -> None:
-        with cls.conn as transaction:
+        with cls.connection() as transaction:
             transaction.execute('insert or ignore into user (uid, platform) values (?, ?)', (user_id, platform))
 
     @classmethod
     def get_user(cls, user_id: int, platform: str = 'tg') -> tuple[Optional[str], bool]:
-        cur: sqlite3.Cursor = cls.conn.execute('select gid, trusted from user where uid = ? and platform = ?', (user_id, platform))
+        cur: sqlite3.Cursor = cls.connection().execute('select gid, trusted from user where uid = ? and platform = ?', (user_id, platform))
         result = cur.fetchone()
         return result[0], bool(result[1])
 
     @classmethod
     def trust_user(cls, user_id: int, platform: str = 'tg') -> None:
-        with cls.conn as transaction:
+        with cls.connection() as transaction:
             transaction.execute('update user set trusted = 1 where uid = ? and platform = ?', (user_id, platform))
 
     @classmethod
     def is_trusted_user(cls, user_id: int, platform: str = 'tg') -> bool:
-        cur: sqlite3.Cursor = cls.conn.execute('select 1 from user where uid = ? and trusted = 1 and platform = ?', (user_id, platform))
+        cur: sqlite3.Cursor = cls.connection().execute('select 1 from user where uid = ? and trusted = 1 and platform = ?', (user_id, platform))
         return bool(cur.fetchone())
 
     @classmethod
     def user_exists(cls, user_id: int, platform: str = 'tg') -> bool:
-        cur: sqlite3.Cursor = cls.conn.execute('select 1 from user where uid = ? and platform = ?', (user_id, platform))
+        cur: sqlite3.Cursor = cls.connection().execute('select 1 from user where uid = ? and platform = ?', (user_id, platform))
         return bool(cur.fetchone())
 
     @classmethod
     def delete_user(cls, user_id: int, platform: str = 'tg') -> None:
-        with cls.conn as transaction:
+        with cls.connection() as transaction:
             transaction.execute('delete from user where uid = ? and platform = ?', (user_id, platform))
 
     @classmethod
     def get_areas(cls) -> list[str]:
-        cur: sqlite3.Cursor = cls.conn.execute('select distinct area from class')
+        cur: sqlite3.Cursor = cls.connection().execute('select distinct area from class')
         return [i[0] for i in cur.fetchall()]
 
     @classmethod
     def get_all_recent_classes_for_area(cls, area: str) -> list[str]:
         # only selects groups that have been active in the last 3 months
-        cur: sqlite3.Cursor = cls.conn.execute(
+        cur: sqlite3.Cursor = cls.connection().execute(
             "select gid from class where area = ? and last_update > strftime('%s', 'now') - 7777777",
             (area,)
         )
@@ -77,60 +186,217 @@ class DB:
 
     @classmethod
     def check_if_class_exists(cls, area: str, class_id: str) -> bool:
-        cur: sqlite3.Cursor = cls.conn.execute('select 1 from class where area = ? and gid = ?', (area, class_id))
+        cur: sqlite3.Cursor = cls.connection().execute('select 1 from class where area = ? and gid = ?', (area, class_id))
         return bool(cur.fetchone())
 
     @classmethod
     def add_user_to_class(cls, user_id: int, class_id: str, platform: str = 'tg') -> None:
-        with cls.conn as transaction:
+        with cls.connection() as transaction:
             transaction.execute('update user set gid = ? where uid = ? and platform = ?', (class_id, user_id, platform))
 
     @classmethod
     def clear_user_class(cls, user_id: int, platform: str = 'tg') -> None:
-        with cls.conn as transaction:
+        with cls.connection() as transaction:
             transaction.execute('update user set gid = null where uid = ? and platform = ?', (user_id, platform))
 
     @classmethod
-    def get_all_substitutions_for_user(cls, uid: int, platform: str = 'tg') -> list[Substitution]:
-        cur: sqlite3.Cursor = cls.conn.execute(
-            "select gid, day, lesson, teacher, subject, room, notes, area, u.last_update < s.last_update from user u"
-            " join substitution s using (gid) join class using (gid) where uid = ? and platform = ? and "
-            "day > strftime('%s', 'now') - 86200 order by day, lesson asc",
-            (uid, platform)
+    def get_recent_substitutions_for_class(cls, gid: str) -> list[tuple[Substitution, int]]:
+        cur: sqlite3.Cursor = cls.connection().execute(
+            "select gid, day, lesson, teacher, subject, room, notes, area, seq from substitution s "
+            "join class using (gid) where gid = ? and day > strftime('%s', 'now') - 86200 order by day, lesson asc",
+            (gid,)
         )
-        return [Substitution(*row) for row in cur.fetchall()]
+        return [(Substitution(*row[:8], False), row[8]) for row in cur.fetchall()]
 
     @classmethod
-    def get_all_updated_users(cls, platform: str = 'tg') -> list[int]:
-        cur: sqlite3.Cursor = cls.conn.execute(
-            "select distinct uid from user u join substitution s using (gid) "
-            "where platform = ? and s.last_update > u.last_update and day > strftime('%s', 'now') - 86200",
-            (platform,)
+    def get_user_class_and_last_seq(cls, user_id: int, platform: str = 'tg') -> tuple[Optional[str], int]:
+        cur: sqlite3.Cursor = cls.connection().execute(
+            'select gid, last_seq from user where uid = ? and platform = ?', (user_id, platform)
         )
-        return [i[0] for i in cur.fetchall()]
+        return cur.fetchone() or (None, 0)
+
+    @classmethod
+    def get_change_seq(cls) -> int:
+        """The seq of the latest change, read before notifying so later changes aren't marked as seen"""
+        cur: sqlite3.Cursor = cls.connection().execute(
+            "select coalesce(max(seq), 0) from sqlite_sequence where name = 'change_log'"
+        )
+        return cur.fetchone()[0]
+
+    @classmethod
+    def get_pending_notifications(
+        cls, platform: str = 'tg', gids: Optional[Collection[str]] = None
+    ) -> list[PendingClass]:
+        """
+        Returns all users with unseen changes together with the recent substitutions of their class,
+        grouped by class. Costs two queries regardless of the number of users. gids limits it to these classes.
+        """
+        class_filter: str = ''
+        class_args: tuple[str, ...] = ()
+        if gids is not None:
+            class_filter = f" and gid in ({', '.join('?' * len(gids))})"
+            class_args = tuple(gids)
+        users: sqlite3.Cursor = cls.connection().execute(
+            "select gid, uid, last_seq from user u where platform = ? and exists (select 1 from change_log c "
+            "where c.gid = u.gid and c.seq > u.last_seq and day > strftime('%s', 'now') - 86200)"
+            f"{class_filter} order by gid",
+            (platform, *class_args)
+        )
+        substitutions: sqlite3.Cursor = cls.connection().execute(
+            "select gid, day, lesson, teacher, subject, room, notes, area, seq from substitution s "
+            "join class using (gid) where day > strftime('%s', 'now') - 86200 and gid in "
+            f"(select gid from user where platform = ? and gid is not null){class_filter} "
+            "order by gid, day, lesson asc",
+            (platform, *class_args)
+        )
+        substitution_groups = groupby(substitutions, key=itemgetter(0))
+        current_gid, rows = next(substitution_groups, (None, iter(())))
+        pending: list[PendingClass] = []
+        for gid, user_rows in groupby(users, key=itemgetter(0)):
+            # both cursors are ordered by gid, so the substitutions can be merged in
+            while current_gid is not None and current_gid < gid:
+                current_gid, rows = next(substitution_groups, (None, iter(())))
+            class_substitutions: list[tuple[Substitution, int]] = []
+            if current_gid == gid:
+                class_substitutions = [(Substitution(*row[:8], False), row[8]) for row in rows]
+            pending.append(PendingClass(gid, [(row[1], row[2]) for row in user_rows], class_substitutions))
+        return pending
+
+    @classmethod
+    def mark_users_updated(cls, user_ids: list[int], seq: int, platform: str = 'tg') -> None:
+        with cls.connection() as transaction:
+            transaction.executemany(
+                'update user set last_seq = max(last_seq, ?) where uid = ? and platform = ?',
+                [(seq, uid, platform) for uid in user_ids]
+            )
 
     @classmethod
     def update_user(cls, user_id: int, platform: str = 'tg', is_zero: bool = False) -> None:
-        with cls.conn as transaction:
-            target: int = 0 if is_zero else time.time()
-            transaction.execute("update user set last_update = ? where uid = ? and platform = ?", (target, user_id, platform))
+        """Marks all changes as seen by the user, or with is_zero all as unseen"""
+        with cls.connection() as transaction:
+            target: int = 0 if is_zero else cls.get_change_seq()
+            transaction.execute("update user set last_seq = ? where uid = ? and platform = ?", (target, user_id, platform))
 
     @classmethod
     def add_class_if_not_exists(cls, gid: str, area: str) -> None:
-        with cls.conn as transaction:
+        with cls.connection() as transaction:
             transaction.execute('insert into class (gid, area) values (?, ?) on conflict do nothing', (gid, area))
 
     @classmethod
-    def insert_or_modify_substitution(cls, s: Substitution) -> bool:
-        with cls.conn as transaction:
-            cls.add_class_if_not_exists(s.group, s.area)
-            transaction.execute("update class set last_update = strftime('%s', 'now') where gid = ?", (s.group,))
+    def apply_plan(cls, area: str, substitutions: Iterable[Substitution]) -> ChangeSet:
+        """
+        Diffs a freshly parsed plan against the stored rows of its area and day range
+        and applies all inserts, updates and removals in one transaction.
+        Rows of the plan's classes count as stored even if a user created the class under another area.
+        Inserts and updates are appended to the change log, removals aren't shown to users.
+        substitutions is consumed once, so it may be a lazy iterator like PDF.to_substitutions.
+        """
+        new: dict[SubstitutionKey, Substitution] = {s.key: s for s in substitutions}
+        if not new:
+            return ChangeSet([], [], [])
+        first_day: int = min(s.day for s in new.values())
+        last_day: int = max(s.day for s in new.values())
+        gids: set[str] = {s.group for s in new.values()}
+        with cls.connection() as transaction:
+            cur: sqlite3.Cursor = transaction.execute(
+                'select sid, gid, day, lesson, teacher, subject, room, notes, area from substitution '
+                f"join class using (gid) where (area = ? or gid in ({', '.join('?' * len(gids))})) "
+                'and day between ? and ?',
+                (area, *gids, first_day, last_day)
+            )
+            existing: dict[SubstitutionKey, tuple[int, Substitution]] = {
+                s.key: (sid, s) for sid, s in ((row[0], Substitution(*row[1:], False)) for row in cur.fetchall())
+            }
+            inserted: list[Substitution] = []
+            updated: list[tuple[int, Substitution]] = []
+            for key, s in new.items():
+                if key not in existing:
+                    inserted.append(s)
+                    continue
+                sid, old = existing[key]
+                if old.content != s.content:
+                    updated.append((sid, s))
+            removed: list[tuple[int, Substitution]] = [v for k, v in existing.items() if k not in new]
+            changed_classes: set[str] = {s.group for s in inserted} | {s.group for _, s in updated + removed}
+            # there is only one writer, so nothing else can take these seqs
+            head: int = cls.get_change_seq()
+            changes: list[Substitution] = inserted + [s for _, s in updated]
+            seqs: dict[SubstitutionKey, int] = {s.key: head + i for i, s in enumerate(changes, start=1)}
+
+            transaction.executemany(
+                'insert into class (gid, area) values (?, ?) on conflict do nothing',
+                {(s.group, area) for s in inserted}
+            )
+            transaction.executemany(
+                "update class set last_update = strftime('%s', 'now') where gid = ?",
+                [(gid,) for gid in changed_classes]
+            )
+            transaction.executemany(
+                'insert into substitution (gid, day, lesson, teacher, subject, room, notes, seq) '
+                'values (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(s.group, s.day, s.lesson, s.teacher, s.subject, s.room, s.notes, seqs[s.key]) for s in inserted]
+            )
+            transaction.executemany(
+                "update substitution set teacher = ?, subject = ?, room = ?, notes = ?, seq = ?, "
+                "last_update = strftime('%s', 'now') where sid = ?",
+                [(s.teacher, s.subject, s.room, s.notes, seqs[s.key], sid) for sid, s in updated]
+            )
+            transaction.executemany('delete from substitution where sid = ?', [(sid,) for sid, _ in removed])
+            transaction.executemany(
+                'insert into change_log (seq, gid, day, lesson) values (?, ?, ?, ?)',
+                [(seqs[s.key], s.group, s.day, s.lesson) for s in changes]
+            )
+        return ChangeSet(inserted, [s for _, s in updated], [s for _, s in removed])
+
+    @classmethod
+    def compact_change_log(cls, retention: int) -> int:
+        """
+        Drops log entries older than retention seconds and those of days that aren't shown anymore.
+        Users that haven't seen them keep their last_seq, the seqs themselves are never reused.
+        """
+        with cls.connection() as transaction:
             cur: sqlite3.Cursor = transaction.execute(
-                "insert into substitution (gid, day, lesson, teacher, subject, room, notes) "
-                "values (?, ?, ?, ?, ?, ?, ?) on conflict (gid, day, lesson) do update set teacher = excluded.teacher, "
-                "subject = excluded.subject, room = excluded.room, notes = excluded.notes, "
-                "last_update = strftime('%s', 'now') where teacher <> excluded.teacher or "
-                "subject <> excluded.subject or room <> excluded.room or notes <> excluded.notes returning *",
-                (s.group, s.day, s.lesson, s.teacher, s.subject, s.room, s.notes)
+                "delete from change_log where created < strftime('%s', 'now') - ? "
+                "or day <= strftime('%s', 'now') - 86200",
+                (retention,)
+            )
+            return cur.rowcount
+
+    @classmethod
+    def add_plan_modifications(cls, modifications: dict[str, int]) -> None:
+        with cls.connection() as transaction:
+            transaction.executemany(
+                'insert into plan_modification (plan, modified) values (?, ?) on conflict do nothing',
+                modifications.items()
+            )
+
+    @classmethod
+    def get_plan_modifications(cls, since: int) -> list[int]:
+        cur: sqlite3.Cursor = cls.connection().execute(
+            'select modified from plan_modification where modified > ?', (since,)
+        )
+        return [row[0] for row in cur.fetchall()]
+
+    @classmethod
+    def prune_plan_modifications(cls, before: int) -> int:
+        """Drops the modification times the poll scheduler doesn't look at anymore"""
+        with cls.connection() as transaction:
+            cur: sqlite3.Cursor = transaction.execute('delete from plan_modification where modified <= ?', (before,))
+            return cur.rowcount
+
+    @classmethod
+    def get_crawl_states(cls) -> dict[str, CrawlState]:
+        cur: sqlite3.Cursor = cls.connection().execute(
+            'select plan, listing_modified, digest, parse_duration, row_count from crawl_state'
+        )
+        return {row[0]: CrawlState(*row) for row in cur.fetchall()}
+
+    @classmethod
+    def set_crawl_state(cls, state: CrawlState) -> None:
+        with cls.connection() as transaction:
+            transaction.execute(
+                'insert into crawl_state (plan, listing_modified, digest, parse_duration, row_count) '
+                'values (?, ?, ?, ?, ?) on conflict (plan) do update set listing_modified = excluded.listing_modified, '
+                'digest = excluded.digest, parse_duration = excluded.parse_duration, row_count = excluded.row_count',
+                (state.plan, state.listing_modified, state.digest, state.parse_duration, state.row_count)
             )
-            return bool(cur.fetchone())
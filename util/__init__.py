@@ -1,13 +1,7 @@
-import requests
+from .credential_verifier import credential_verifier
 
-from .DB import DB
 
-
-def check_credentials(username: str, password: str) -> bool:
+async def check_credentials(username: str, password: str) -> bool:
     if len(username) > 20 or len(password) > 20:
         return False
-    r: requests.Response = requests.get('https://geschuetzt.bszet.de', auth=(username, password))
-    success: bool = r.status_code == 200
-    if success:
-        DB.add_new_credential(username, password)
-    return success
+    return await credential_verifier.check(username, password)
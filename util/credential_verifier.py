@@ -0,0 +1,65 @@
+import asyncio
+import hashlib
+import time
+from logging import warning
+from os import getenv
+from typing import Optional
+
+import aiohttp
+
+from .DB import DB
+
+BASE_URL: str = 'https://geschuetzt.bszet.de'
+
+
+class CredentialVerifier:
+    """
+    Checks credentials for geschuetzt.bszet.de without blocking the event loop.
+    Accepted credentials are remembered by their hash for ttl seconds,
+    concurrent checks of the same credentials share one request.
+    """
+
+    def __init__(self, timeout: float = 10.0, ttl: float = 24 * 60 * 60, base_url: Optional[str] = None) -> None:
+        self.timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(total=timeout)
+        self.ttl: float = ttl
+        # read on first use, the environment isn't loaded yet when the module is imported
+        self.base_url: Optional[str] = base_url
+        # credential hash -> time.monotonic() it expires
+        self.__valid: dict[bytes, float] = {}
+        self.__pending: dict[bytes, asyncio.Task[bool]] = {}
+
+    @staticmethod
+    def key(username: str, password: str) -> bytes:
+        return hashlib.sha256(f'{username}\0{password}'.encode()).digest()
+
+    async def check(self, username: str, password: str) -> bool:
+        key: bytes = self.key(username, password)
+        expires: Optional[float] = self.__valid.get(key)
+        if expires is not None:
+            if expires > time.monotonic():
+                return True
+            del self.__valid[key]
+        task: Optional[asyncio.Task[bool]] = self.__pending.get(key)
+        if task is None:
+            task = asyncio.create_task(self.__request(key, username, password))
+            self.__pending[key] = task
+            task.add_done_callback(lambda _: self.__pending.pop(key, None))
+        # a cancelled caller mustn't cancel the request the others wait for
+        return await asyncio.shield(task)
+
+    async def __request(self, key: bytes, username: str, password: str) -> bool:
+        url: str = self.base_url or getenv('PLAN_BASE_URL') or BASE_URL
+        try:
+            async with aiohttp.ClientSession(timeout=self.timeout) as session:
+                async with session.get(url, auth=aiohttp.BasicAuth(username, password)) as resp:
+                    success: bool = resp.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            warning(f'Error checking credentials, {e!r}')
+            return False
+        if success:
+            await DB.write(DB.add_new_credential, username, password)
+            self.__valid[key] = time.monotonic() + self.ttl
+        return success
+
+
+credential_verifier: CredentialVerifier = CredentialVerifier()
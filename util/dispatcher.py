@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from logging import exception, info, warning
+from typing import Awaitable, Callable, Hashable, Optional
+
+from .metrics import Counter, Gauge, metrics
+
+Job = Callable[[], Awaitable[None]]
+
+# counted by the bots, labelled with the dispatcher's name
+SENT: Counter = metrics.counter('bszet_notifications_sent_total', 'Notifications delivered', ('platform',))
+FORBIDDEN: Counter = metrics.counter(
+    'bszet_notifications_forbidden_total', 'Notifications to chats that blocked the bot', ('platform',)
+)
+RATE_LIMITED: Counter = metrics.counter(
+    'bszet_notifications_rate_limited_total', 'Notifications the platform answered with 429', ('platform',)
+)
+QUEUE_DEPTH: Gauge = metrics.gauge(
+    'bszet_notification_queue_depth', 'Notifications waiting to be sent', ('platform',)
+)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate: float = rate
+        self.capacity: float = capacity
+        self.tokens: float = capacity
+        self.__updated: float = time.monotonic()
+        self.__lock: asyncio.Lock = asyncio.Lock()
+
+    def __refill(self) -> None:
+        now: float = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.__updated) * self.rate)
+        self.__updated = now
+
+    @property
+    def is_full(self) -> bool:
+        self.__refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self) -> None:
+        async with self.__lock:
+            self.__refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.__refill()
+            self.tokens -= 1
+
+
+class Dispatcher:
+    """
+    Sends notifications with bounded concurrency, limited by a global token bucket and one token bucket per chat.
+    A chat is only queued once at a time. Exceptions for which retry_after returns a delay are retried after it.
+    """
+
+    def __init__(
+        self, name: str, rate: float, per_chat_rate: float, per_chat_burst: float = 1.0, concurrency: int = 16,
+        retry_after: Callable[[Exception], Optional[float]] = lambda _: None, max_retries: int = 3
+    ) -> None:
+        self.name: str = name
+        self.per_chat_rate: float = per_chat_rate
+        self.per_chat_burst: float = per_chat_burst
+        self.concurrency: int = concurrency
+        self.retry_after: Callable[[Exception], Optional[float]] = retry_after
+        self.max_retries: int = max_retries
+        self.__global: TokenBucket = TokenBucket(rate, rate)
+        self.__chats: dict[Hashable, TokenBucket] = {}
+        self.__pending: set[Hashable] = set()
+        self.__queue: Optional[asyncio.Queue[tuple[Hashable, Job]]] = None
+        self.__workers: list[asyncio.Task] = []
+        QUEUE_DEPTH.track(lambda: self.queue_depth, platform=name)
+
+    @property
+    def queue_depth(self) -> int:
+        return self.__queue.qsize() if self.__queue else 0
+
+    def __ensure_workers(self) -> asyncio.Queue[tuple[Hashable, Job]]:
+        if self.__queue is None:
+            self.__queue = asyncio.Queue()
+            self.__workers = [asyncio.create_task(self.__worker()) for _ in range(self.concurrency)]
+        return self.__queue
+
+    def __chat_bucket(self, chat: Hashable) -> TokenBucket:
+        if chat not in self.__chats:
+            if len(self.__chats) > 10000:
+                # idle chats are back at full capacity, so forgetting them changes nothing
+                self.__chats = {k: v for k, v in self.__chats.items() if not v.is_full}
+            self.__chats[chat] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        return self.__chats[chat]
+
+    def submit(self, chat: Hashable, job: Job) -> bool:
+        """Queues job for chat, returns False if the chat is already queued"""
+        if chat in self.__pending:
+            return False
+        self.__pending.add(chat)
+        self.__ensure_workers().put_nowait((chat, job))
+        return True
+
+    async def join(self) -> None:
+        """Waits until all queued jobs are done"""
+        if self.__queue:
+            await self.__queue.join()
+
+    async def __run(self, chat: Hashable, job: Job) -> None:
+        for attempt in range(self.max_retries + 1):
+            await self.__chat_bucket(chat).acquire()
+            await self.__global.acquire()
+            try:
+                await job()
+                return
+            except Exception as e:
+                delay: Optional[float] = self.retry_after(e)
+                if delay is None or attempt == self.max_retries:
+                    raise
+                warning(f'{self.name}: rate limited for {chat}, retrying after {delay}s')
+                await asyncio.sleep(delay)
+
+    async def __worker(self) -> None:
+        while True:
+            chat, job = await self.__queue.get()
+            try:
+                await self.__run(chat, job)
+            except Exception:
+                exception(f'{self.name}: sending to {chat} failed')
+            finally:
+                self.__pending.discard(chat)
+                self.__queue.task_done()
+
+    async def dispatch(self, jobs: dict[Hashable, Job]) -> None:
+        """Queues all jobs and waits until they are sent"""
+        for chat, job in jobs.items():
+            self.submit(chat, job)
+        info(f'{self.name}: {self.queue_depth} notifications queued')
+        await self.join()
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Iterable
+
+
+class Subscription:
+    """Collects the classes changed since the last wait, so a burst of changes is handled at once"""
+
+    def __init__(self, bus: EventBus) -> None:
+        self.bus: EventBus = bus
+        self.__changed: set[str] = set()
+        self.__event: asyncio.Event = asyncio.Event()
+
+    def add(self, gids: Iterable[str]) -> None:
+        self.__changed.update(gids)
+        if self.__changed:
+            self.__event.set()
+
+    async def wait(self) -> set[str]:
+        """Returns all classes changed since the last call, waiting for the first one if there are none"""
+        await self.__event.wait()
+        self.__event.clear()
+        changed, self.__changed = self.__changed, set()
+        return changed
+
+    def close(self) -> None:
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """In-process pub/sub of changed classes, from the substitution writer to the bots"""
+
+    def __init__(self) -> None:
+        self.__subscriptions: list[Subscription] = []
+
+    def subscribe(self) -> Subscription:
+        subscription: Subscription = Subscription(self)
+        self.__subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if subscription in self.__subscriptions:
+            self.__subscriptions.remove(subscription)
+
+    def publish(self, gids: Iterable[str]) -> None:
+        gids = set(gids)
+        for subscription in self.__subscriptions:
+            subscription.add(gids)
+
+
+event_bus: EventBus = EventBus()
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+from substitution_parsing.Substitution import Substitution
+
+from .DB import DB
+
+CacheKey = tuple[str, str, int]
+# seconds a substitution stays visible after the start of its day
+RECENT_DAYS: int = 86200
+
+
+class RenderedClass:
+    """The formatted lines of all recent substitutions of a class, bold highlighting is applied per user"""
+
+    def __init__(self, rows: list[tuple[int, int, str]]) -> None:
+        # (day, seq, line)
+        self.rows: list[tuple[int, int, str]] = rows
+
+    def render(self, since: int, bold: Callable[[str], str]) -> Optional[str]:
+        """Returns the message for a user that has seen all changes up to seq since, or None if nothing is new"""
+        cutoff: float = time.time() - RECENT_DAYS
+        result: str = 'Aktuelle Vertretungen:\n\n'
+        is_new: bool = False
+        for day, seq, line in self.rows:
+            if day <= cutoff:
+                continue
+            if seq > since:
+                line = bold(line)
+                is_new = True
+            result += line + '\n'
+        return result if is_new else None
+
+
+class MessageCache:
+    """
+    LRU cache of rendered substitution lines keyed by (gid, platform, content version).
+    The version of a class is bumped by invalidate whenever the substitution writer changes it.
+    Callers take the version before reading the substitutions, so rows read before a change
+    are never cached under the version that follows it.
+    """
+
+    def __init__(self, max_size: int = 1024) -> None:
+        self.max_size: int = max_size
+        self.__entries: OrderedDict[CacheKey, RenderedClass] = OrderedDict()
+        self.__versions: dict[str, int] = {}
+
+    def invalidate(self, gids: Iterable[str]) -> None:
+        for gid in gids:
+            self.__versions[gid] = self.__versions.get(gid, 0) + 1
+
+    def versions(self) -> dict[str, int]:
+        """The current version of every class, to be taken before reading their substitutions"""
+        return dict(self.__versions)
+
+    def __lookup(self, key: CacheKey) -> Optional[RenderedClass]:
+        if key in self.__entries:
+            self.__entries.move_to_end(key)
+            return self.__entries[key]
+        return None
+
+    def get(
+        self, gid: str, platform: str, format_line: Callable[[Substitution], str],
+        substitutions: list[tuple[Substitution, int]], versions: dict[str, int]
+    ) -> RenderedClass:
+        """On a miss, substitutions are rendered and cached under their version in versions"""
+        key: CacheKey = (gid, platform, versions.get(gid, 0))
+        if cached := self.__lookup(key):
+            return cached
+        rendered: RenderedClass = RenderedClass(
+            [(s.day, seq, format_line(s)) for s, seq in substitutions]
+        )
+        self.__entries[key] = rendered
+        if len(self.__entries) > self.max_size:
+            self.__entries.popitem(last=False)
+        return rendered
+
+    async def load(self, gid: str, platform: str, format_line: Callable[[Substitution], str]) -> RenderedClass:
+        """Like get, but loads the substitutions from the DB on a miss"""
+        versions: dict[str, int] = {gid: self.__versions.get(gid, 0)}
+        if cached := self.__lookup((gid, platform, versions[gid])):
+            return cached
+        substitutions: list[tuple[Substitution, int]] = await DB.read(DB.get_recent_substitutions_for_class, gid)
+        return self.get(gid, platform, format_line, substitutions, versions)
+
+
+message_cache: MessageCache = MessageCache()
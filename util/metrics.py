@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from aiohttp import web
+
+# label values in the order of the metric's label names
+LabelValues = tuple[str, ...]
+
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+# 1 KiB to 16 MiB
+SIZE_BUCKETS: tuple[float, ...] = tuple(float(2 ** i) for i in range(10, 25, 2))
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric(ABC):
+    """A named metric with one value per combination of label values, safe to update from any thread"""
+    kind: str = 'untyped'
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()) -> None:
+        self.name: str = name
+        self.description: str = description
+        self.labels: tuple[str, ...] = labels
+        self.lock: threading.Lock = threading.Lock()
+
+    def key(self, labels: dict[str, str]) -> LabelValues:
+        if labels.keys() != set(self.labels):
+            raise ValueError(f'{self.name} has the labels {self.labels}, got {tuple(labels)}')
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def format_labels(self, key: LabelValues, extra: Optional[tuple[str, str]] = None) -> str:
+        pairs: list[tuple[str, str]] = list(zip(self.labels, key)) + ([extra] if extra else [])
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        ...
+
+    def render(self) -> str:
+        lines: list[str] = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind: str = 'counter'
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, description, labels)
+        self.values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key: LabelValues = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self.lock:
+            values: list[tuple[LabelValues, float]] = list(self.values.items())
+        for key, value in values:
+            yield f'{self.name}{self.format_labels(key)} {format_value(value)}'
+
+
+class Gauge(Metric):
+    """A value that goes up and down, either set directly or read from a callback when rendered"""
+    kind: str = 'gauge'
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, description, labels)
+        self.values: dict[LabelValues, float | Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key: LabelValues = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def track(self, callback: Callable[[], float], **labels: str) -> None:
+        key: LabelValues = self.key(labels)
+        with self.lock:
+            self.values[key] = callback
+
+    def samples(self) -> Iterator[str]:
+        with self.lock:
+            values: list[tuple[LabelValues, float | Callable[[], float]]] = list(self.values.items())
+        for key, value in values:
+            yield f'{self.name}{self.format_labels(key)} {format_value(value() if callable(value) else value)}'
+
+
+class Histogram(Metric):
+    kind: str = 'histogram'
+
+    def __init__(
+        self, name: str, description: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, description, labels)
+        self.buckets: tuple[float, ...] = tuple(sorted(buckets)) + (float('inf'),)
+        # per label values: the count of every bucket, not cumulative, the sum and the count
+        self.values: dict[LabelValues, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key: LabelValues = self.key(labels)
+        index: int = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = ([0] * len(self.buckets), [0.0, 0.0])
+            counts, totals = self.values[key]
+            counts[index] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observes the seconds spent inside the with block, also if it raises"""
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[str]:
+        with self.lock:
+            values: list[tuple[LabelValues, list[int], list[float]]] = [
+                (key, list(counts), list(totals)) for key, (counts, totals) in self.values.items()
+            ]
+        for key, counts, totals in values:
+            cumulative: int = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket{self.format_labels(key, ("le", format_value(bound)))} {cumulative}'
+            yield f'{self.name}_sum{self.format_labels(key)} {format_value(totals[0])}'
+            yield f'{self.name}_count{self.format_labels(key)} {int(totals[1])}'
+
+
+class Registry:
+    """
+    Holds all metrics of the process and renders them in the prometheus text format.
+    Registering a name again returns the existing metric, so modules can declare the metrics they share.
+    """
+
+    def __init__(self) -> None:
+        self.__metrics: dict[str, Metric] = {}
+        self.__lock: threading.Lock = threading.Lock()
+
+    def __register(self, metric: Metric) -> Metric:
+        with self.__lock:
+            existing: Optional[Metric] = self.__metrics.get(metric.name)
+            if existing is None:
+                self.__metrics[metric.name] = metric
+                return metric
+        if type(existing) is not type(metric) or existing.labels != metric.labels:
+            raise ValueError(f'{metric.name} is already registered as a different metric')
+        return existing
+
+    def counter(self, name: str, description: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.__register(Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self.__register(Gauge(name, description, labels))
+
+    def histogram(
+        self, name: str, description: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.__register(Histogram(name, description, labels, buckets))
+
+    def render(self) -> str:
+        with self.__lock:
+            metrics: list[Metric] = sorted(self.__metrics.values(), key=lambda metric: metric.name)
+        return ''.join(metric.render() + '\n' for metric in metrics)
+
+
+metrics: Registry = Registry()
+
+
+async def serve_metrics(port: int, host: str = '127.0.0.1', registry: Registry = metrics) -> None:
+    """Serves registry on http://host:port/metrics until cancelled"""
+
+    async def exposition(_: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+    app: web.Application = web.Application()
+    app.router.add_get('/metrics', exposition)
+    runner: web.AppRunner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
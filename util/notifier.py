@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import asyncio
+from functools import partial
+from logging import exception
+from typing import Awaitable, Callable, Collection, Optional
+
+from substitution_parsing.Substitution import Substitution
+
+from .DB import DB
+from .dispatcher import FORBIDDEN, RATE_LIMITED, SENT, Dispatcher, Job
+from .event_bus import Subscription, event_bus
+from .message_cache import RenderedClass, message_cache
+
+# delivered chats are marked in batches of this size while the round is still sending
+MARK_BATCH: int = 100
+
+
+class Notifier:
+    """
+    Sends the pending substitutions of a platform's chats through its dispatcher.
+    send delivers one message and returns False if the chat has blocked the bot, which deletes the chat.
+    Arguments after the chat id and text, e.g. the telegram bot, are passed through to send.
+    """
+
+    def __init__(
+        self, platform: str, dispatcher: Dispatcher, send: Callable[..., Awaitable[bool]],
+        format_line: Callable[[Substitution], str], bold: Callable[[str], str]
+    ) -> None:
+        self.platform: str = platform
+        self.dispatcher: Dispatcher = dispatcher
+        self.send: Callable[..., Awaitable[bool]] = send
+        self.format_line: Callable[[Substitution], str] = format_line
+        self.bold: Callable[[str], str] = bold
+        # the event bus listener and the safety net poll both notify, one round at a time so nobody is queued twice
+        self.__lock: asyncio.Lock = asyncio.Lock()
+
+    async def send_update(self, uid: int, text: str, *args) -> bool:
+        try:
+            if not await self.send(uid, text, *args):
+                FORBIDDEN.inc(platform=self.dispatcher.name)
+                await DB.write(DB.delete_user, uid, platform=self.platform)
+                return False
+        except Exception as e:
+            if self.dispatcher.retry_after(e) is not None:
+                RATE_LIMITED.inc(platform=self.dispatcher.name)
+            raise
+        SENT.inc(platform=self.dispatcher.name)
+        return True
+
+    async def update_user(self, uid: int, *args) -> None:
+        """Sends the current substitutions of the user's class, e.g. right after the class was set"""
+        seq: int = await DB.read(DB.get_change_seq)
+        gid, last_seq = await DB.read(DB.get_user_class_and_last_seq, uid, platform=self.platform)
+        if not gid:
+            return
+        rendered: RenderedClass = await message_cache.load(gid, self.platform, self.format_line)
+        result: Optional[str] = rendered.render(last_seq, self.bold)
+        if result and await self.send_update(uid, result, *args):
+            await DB.write(DB.mark_users_updated, [uid], seq, platform=self.platform)
+
+    async def notify(self, *args, gids: Optional[Collection[str]] = None) -> None:
+        """Sends all pending notifications, only for the classes in gids if given"""
+        async with self.__lock:
+            seq: int = await DB.read(DB.get_change_seq)
+            delivered: list[int] = []
+
+            async def notify(uid: int, text: str) -> None:
+                nonlocal delivered
+                if await self.send_update(uid, text, *args):
+                    delivered.append(uid)
+                    if len(delivered) >= MARK_BATCH:
+                        batch, delivered = delivered, []
+                        await DB.write(DB.mark_users_updated, batch, seq, platform=self.platform)
+
+            jobs: dict[int, Job] = {}
+            versions: dict[str, int] = message_cache.versions()
+            for pending in await DB.read(DB.get_pending_notifications, self.platform, gids):
+                rendered: RenderedClass = message_cache.get(
+                    pending.gid, self.platform, self.format_line, pending.substitutions, versions
+                )
+                for uid, last_seq in pending.users:
+                    if text := rendered.render(last_seq, self.bold):
+                        jobs[uid] = partial(notify, uid, text)
+            await self.dispatcher.dispatch(jobs)
+            await DB.write(DB.mark_users_updated, delivered, seq, platform=self.platform)
+
+    async def listen(self, *args) -> None:
+        """Notifies the chats of a class as soon as the substitution writer publishes a change to it"""
+        subscription: Subscription = event_bus.subscribe()
+        try:
+            while True:
+                gids: set[str] = await subscription.wait()
+                try:
+                    await self.notify(*args, gids=gids)
+                except Exception:
+                    exception(f'notifying the {self.dispatcher.name} chats of {gids} failed')
+        finally:
+            subscription.close()